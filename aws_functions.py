@@ -1,38 +1,216 @@
-import boto3
-from botocore.exceptions import ClientError
+import json
+import logging
+import os
+import threading
+import time
+
+from tracing_functions import span
+
+# boto3/botocore take over 100ms to import, so they are imported on first use rather than here,
+# keeping cold starts that never reach AWS (e.g. no new stories) cheap
+
+# Lambda resolves credentials from its execution role, so only use the named profile when running locally
+aws_profile_name = os.environ.get(
+    "AWS_PROFILE_NAME",
+    None if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else "tradesales"
+) or None
+aws_region_name = os.environ.get("AWS_REGION_NAME", "eu-west-2")
+aws_max_pool_connections = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "20"))
+# Optional endpoint overrides, e.g. DynamoDB Local for tests
+aws_endpoint_urls = {
+    "dynamodb": os.environ.get("DYNAMODB_ENDPOINT_URL") or None,
+}
+# Per-service client settings merged over the defaults. Bedrock retries are handled by the
+# rate controller in bedrock_functions, so botocore's own retries are turned off there.
+aws_client_configs = {
+    "bedrock-runtime": {"retries": {"mode": "standard", "max_attempts": 1}},
+}
+secret_cache_ttl = int(os.environ.get("SECRET_CACHE_TTL_SECONDS", "300"))
+
+logger = logging.getLogger()
+
+# Sessions and clients are built once per process and reused across warm Lambda invocations
+_session = None
+_clients = {}
+_registry_lock = threading.Lock()
+
+# BatchWriteItem accepts at most 25 items per request
+dynamodb_batch_write_limit = 25
+dynamodb_batch_write_max_attempts = 5
+
+_serializer = None
+_deserializer = None
+
+# secret name -> (secret string, version id, expires at)
+_secret_cache = {}
+_secret_cache_lock = threading.Lock()
+
+
+def get_session() -> "boto3.Session":
+    """Return the shared boto3 session, creating it on first use."""
+    global _session
+    with _registry_lock:
+        if _session is None:
+            import boto3
+            _session = boto3.Session(profile_name=aws_profile_name, region_name=aws_region_name)
+        return _session
+
+
+def get_client(service_name: str, region_name: str = None):
+    """Return a shared client for the service. Clients are thread safe, so one is kept per service and region."""
+    key = (service_name, region_name or aws_region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    from botocore.config import Config
+
+    session = get_session()
+    with _registry_lock:
+        if key not in _clients:
+            _clients[key] = session.client(
+                service_name,
+                region_name=key[1],
+                endpoint_url=aws_endpoint_urls.get(service_name),
+                config=Config(max_pool_connections=aws_max_pool_connections,
+                              **aws_client_configs.get(service_name, {}))
+            )
+        return _clients[key]
+
+
+def register_client(service_name: str, client, region_name: str = None):
+    """Use the given client for a service, e.g. a local fake for tests and benchmarks."""
+    with _registry_lock:
+        _clients[(service_name, region_name or aws_region_name)] = client
+
+
+def to_dynamodb_item(item: dict) -> dict:
+    """Convert a plain dict to DynamoDB's typed attribute format, for use with the shared client."""
+    global _serializer
+    if _serializer is None:
+        from boto3.dynamodb.types import TypeSerializer
+        _serializer = TypeSerializer()
+    return {key: _serializer.serialize(value) for key, value in item.items()}
+
+
+def from_dynamodb_item(item: dict) -> dict:
+    """Convert an item in DynamoDB's typed attribute format back to a plain dict (numbers are Decimals)."""
+    global _deserializer
+    if _deserializer is None:
+        from boto3.dynamodb.types import TypeDeserializer
+        _deserializer = TypeDeserializer()
+    return {key: _deserializer.deserialize(value) for key, value in item.items()}
+
 
-def get_secret(secret_name):
+def batch_write_items(table_name: str, items):
+    """
+    Put plain-dict items with BatchWriteItem on the shared client, 25 per request, resending any
+    unprocessed items with backoff. Items must not repeat a key within the call.
+    """
+    dynamodb = get_client('dynamodb')
+    items = list(items)
+    for start in range(0, len(items), dynamodb_batch_write_limit):
+        request = {table_name: [
+            {'PutRequest': {'Item': to_dynamodb_item(item)}}
+            for item in items[start:start + dynamodb_batch_write_limit]
+        ]}
 
-    region_name = "eu-west-2"
+        for attempt in range(dynamodb_batch_write_max_attempts):
+            request = dynamodb.batch_write_item(RequestItems=request).get('UnprocessedItems') or {}
+            if not request:
+                break
+            time.sleep(min(2 ** attempt * 0.05, 1))
+        else:
+            raise RuntimeError(f"{len(request[table_name])} items still unprocessed writing to {table_name}")
+
+
+def _cache_secret(secret_name: str, secret: str, version_id: str):
+    with _secret_cache_lock:
+        _secret_cache[secret_name] = (secret, version_id, time.time() + secret_cache_ttl)
+
+
+def invalidate_secret(secret_name: str = None):
+    """Drop one cached secret, or all of them."""
+    with _secret_cache_lock:
+        if secret_name is None:
+            _secret_cache.clear()
+        else:
+            _secret_cache.pop(secret_name, None)
+
+
+def get_secret(secret_name, version_id: str = None):
+    """
+    Return a secret string, served from the in-process cache while it is fresh.
+
+    If version_id is given, a cached value from any other version is ignored and refetched.
+    """
+    with _secret_cache_lock:
+        cached = _secret_cache.get(secret_name)
+    if cached is not None:
+        secret, cached_version_id, expires_at = cached
+        if expires_at > time.time() and (version_id is None or version_id == cached_version_id):
+            return secret
+
+    from botocore.exceptions import ClientError
 
     # Create a Secrets Manager client
-    session = boto3.session.Session(profile_name='tradesales')
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
+    client = get_client('secretsmanager')
 
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-    except ClientError as e:
-        # For a list of exceptions thrown, see
-        # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-        raise e
+    request = {'SecretId': secret_name}
+    if version_id is not None:
+        request['VersionId'] = version_id
 
-    secret = get_secret_value_response['SecretString']
+    # Only fetches are traced; cache hits cost nothing worth measuring
+    with span("get_secret", secret_name=secret_name) as secret_span:
+        try:
+            get_secret_value_response = client.get_secret_value(**request)
+        except ClientError as e:
+            # For a list of exceptions thrown, see
+            # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
+            raise e
+
+        secret = get_secret_value_response['SecretString']
+        secret_span.set(bytes=len(secret.encode('utf-8')))
+    if version_id is None:
+        _cache_secret(secret_name, secret, get_secret_value_response.get('VersionId'))
     return secret
 
-import boto3
-import json
+
+def preload_secrets(secret_names):
+    """Fetch several secrets in one BatchGetSecretValue round-trip and cache them."""
+    secret_names = list(dict.fromkeys(secret_names))
+    client = get_client('secretsmanager')
+
+    with span("preload_secrets", secrets=len(secret_names)):
+        _preload_secrets(client, secret_names)
+
+
+def _preload_secrets(client, secret_names):
+    # BatchGetSecretValue accepts at most 20 secret ids per request
+    for start in range(0, len(secret_names), 20):
+        request = {'SecretIdList': secret_names[start:start + 20]}
+        while True:
+            response = client.batch_get_secret_value(**request)
+
+            for secret_value in response.get('SecretValues', []):
+                _cache_secret(secret_value['Name'], secret_value['SecretString'], secret_value.get('VersionId'))
+
+            for error in response.get('Errors', []):
+                logger.warning(f"Could not preload secret {error.get('SecretId')}: {error.get('Message')}")
+
+            if not response.get('NextToken'):
+                break
+            request['NextToken'] = response['NextToken']
+
 
 def save_tokens_to_secrets(secret_name: str, tokens: dict):
     """Save updated tokens to AWS Secrets Manager."""
-    session = boto3.session.Session(profile_name='tradesales')
-
-    client = session.client('secretsmanager')
-    client.put_secret_value(
+    client = get_client('secretsmanager')
+    secret = json.dumps(tokens)
+    response = client.put_secret_value(
         SecretId=secret_name,
-        SecretString=json.dumps(tokens)
-    )
\ No newline at end of file
+        SecretString=secret
+    )
+
+    # The new version is now current, so replace whatever was cached with it
+    _cache_secret(secret_name, secret, response.get('VersionId'))
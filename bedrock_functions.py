@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from tracing_functions import increment_span_attribute
+
+logger = logging.getLogger()
+
+# Client-side limits for Bedrock calls, set below the account's quotas for the models in use
+bedrock_requests_per_minute = float(os.environ.get("BEDROCK_REQUESTS_PER_MINUTE", "50"))
+bedrock_tokens_per_minute = float(os.environ.get("BEDROCK_TOKENS_PER_MINUTE", "200000"))
+bedrock_max_concurrency = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", "4"))
+bedrock_max_attempts = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "4"))
+
+
+class SchemaViolation(Exception):
+    pass
+
+
+class IncrementalJSONValidator:
+    """
+    Checks a model's JSON output as it streams in.
+
+    Text is fed in chunks. The first non-whitespace character must open the expected top-level
+    type ('{' or '['), brackets must balance, and once the top-level value closes it is decoded
+    and passed to validate(value). Any problem raises SchemaViolation immediately, so a bad
+    generation can be abandoned without waiting for the rest of it. A leading ```json code
+    fence is tolerated.
+    """
+
+    def __init__(self, expected_type: type, validate=None):
+        self.opening = "[" if expected_type is list else "{"
+        self.validate = validate
+        self.buffer = []
+        self.value = None
+        self.complete = False
+        self._started = False
+        self._prefix = ""
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str):
+        for char in text:
+            if self.complete:
+                # Anything after the value other than whitespace or a closing fence is ignored
+                return
+            if not self._started:
+                self._start(char)
+                continue
+
+            self.buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._stack.append("]" if char == "[" else "}")
+            elif char in "]}":
+                if not self._stack or self._stack.pop() != char:
+                    raise SchemaViolation(f"Unbalanced '{char}' in model output")
+                if not self._stack:
+                    self._finish()
+
+    def _start(self, char):
+        if char.isspace():
+            return
+        if char == self.opening:
+            self._started = True
+            self.buffer.append(char)
+            self._stack.append("]" if char == "[" else "}")
+            return
+
+        # Allow the output to be wrapped in a ```json fence
+        self._prefix += char
+        if not "```json".startswith(self._prefix.lower()) and self._prefix != "```":
+            raise SchemaViolation(f"Expected output to start with '{self.opening}', got {self._prefix!r}")
+
+    def _finish(self):
+        self.complete = True
+        try:
+            self.value = json.loads("".join(self.buffer))
+        except ValueError as e:
+            raise SchemaViolation(f"Model output is not valid JSON: {e}")
+        if self.validate is not None and not self.validate(self.value):
+            raise SchemaViolation("Model output does not match the expected structure")
+
+    def close(self):
+        """Call once the stream has ended; raises if the value never completed."""
+        if not self.complete:
+            raise SchemaViolation("Model output ended before the JSON value was complete")
+
+
+def stream_claude(client, model_id: str, payload: dict, validator: IncrementalJSONValidator = None) -> tuple:
+    """
+    Invoke the model with a streaming response, feeding text to the validator as it arrives.
+
+    Returns (text, metrics) where metrics has time_to_first_token_ms, total_ms, input_tokens,
+    output_tokens and the prompt cache counts cache_read_input_tokens and
+    cache_creation_input_tokens. Raises SchemaViolation as soon as the validator rejects the output, after
+    closing the stream so the rest of the generation isn't read.
+    """
+    started = time.perf_counter()
+    metrics = {"time_to_first_token_ms": None, "total_ms": None, "input_tokens": None, "output_tokens": None,
+               "cache_read_input_tokens": None, "cache_creation_input_tokens": None}
+
+    response = client.invoke_model_with_response_stream(
+        modelId=model_id,
+        contentType="application/json",
+        accept="application/json",
+        body=json.dumps(payload)
+    )
+    stream = response["body"]
+
+    text = []
+    try:
+        for event in stream:
+            chunk = event.get("chunk")
+            if not chunk:
+                continue
+            message = json.loads(chunk["bytes"])
+
+            if message["type"] == "message_start":
+                usage = message["message"].get("usage", {})
+                metrics["input_tokens"] = usage.get("input_tokens")
+                metrics["cache_read_input_tokens"] = usage.get("cache_read_input_tokens")
+                metrics["cache_creation_input_tokens"] = usage.get("cache_creation_input_tokens")
+            elif message["type"] == "message_delta":
+                metrics["output_tokens"] = message.get("usage", {}).get("output_tokens")
+            elif message["type"] == "content_block_delta" and message["delta"].get("type") == "text_delta":
+                if metrics["time_to_first_token_ms"] is None:
+                    metrics["time_to_first_token_ms"] = round((time.perf_counter() - started) * 1000)
+                text.append(message["delta"]["text"])
+                if validator is not None:
+                    validator.feed(message["delta"]["text"])
+
+        if validator is not None:
+            validator.close()
+    except SchemaViolation:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+        raise
+    finally:
+        metrics["total_ms"] = round((time.perf_counter() - started) * 1000)
+        logger.info(f"Bedrock stream: first token {metrics['time_to_first_token_ms']}ms, "
+                    f"total {metrics['total_ms']}ms, tokens in/out {metrics['input_tokens']}/{metrics['output_tokens']}")
+
+    return "".join(text).strip(), metrics
+
+
+# Bedrock error codes worth retrying after a backoff
+retryable_error_codes = ("ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException",
+                         "InternalServerException", "ModelNotReadyException")
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """True for throttling and server-side (5xx) errors."""
+    response = getattr(error, "response", None) or {}
+    code = response.get("Error", {}).get("Code")
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+    return code in retryable_error_codes or status == 429 or status >= 500
+
+
+def is_throttling_error(error: Exception) -> bool:
+    response = getattr(error, "response", None) or {}
+    code = response.get("Error", {}).get("Code")
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in ("ThrottlingException", "TooManyRequestsException") or status == 429
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Take amount tokens, sleeping until they are available. Returns the seconds waited."""
+        # A single request larger than the bucket could never be satisfied, so let it through at full capacity
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class BedrockRateController:
+    """
+    Wraps model calls with client-side rate and concurrency control.
+
+    Each call first takes a slot under an AIMD concurrency cap, which grows by one for each
+    cap's worth of successful calls and halves on throttling. It then draws from a
+    requests-per-minute and a tokens-per-minute token bucket. Throttling and 5xx errors are
+    retried with full-jitter exponential backoff. metrics() reports the counters.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, max_concurrency: int,
+                 min_concurrency: int = 1, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._random = random.Random()
+        self._metrics = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "throttles": 0,
+                         "rate_wait_ms": 0, "concurrency_wait_ms": 0, "backoff_ms": 0}
+
+    def _acquire_slot(self):
+        started = time.monotonic()
+        with self._condition:
+            while self.in_flight >= int(self.concurrency_limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self._metrics["concurrency_wait_ms"] += round((time.monotonic() - started) * 1000)
+
+    def _release_slot(self, throttled: bool = False, succeeded: bool = False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+            elif succeeded:
+                self.concurrency_limit = min(float(self.max_concurrency),
+                                             self.concurrency_limit + 1 / self.concurrency_limit)
+            self._condition.notify_all()
+
+    def call(self, fn, estimated_tokens: int = 0):
+        """Run fn() under the limits, retrying throttling/5xx errors. Re-raises the last error."""
+        with self._condition:
+            self._metrics["calls"] += 1
+
+        for attempt in range(self.max_attempts):
+            self._acquire_slot()
+            waited = self.request_bucket.acquire(1) + self.token_bucket.acquire(estimated_tokens)
+
+            throttled = succeeded = False
+            try:
+                result = fn()
+                succeeded = True
+                return result
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                if not is_retryable_error(e) or attempt + 1 >= self.max_attempts:
+                    with self._condition:
+                        self._metrics["failures"] += 1
+                        self._metrics["throttles"] += int(throttled)
+                    raise
+                error = e
+            finally:
+                self._release_slot(throttled=throttled, succeeded=succeeded)
+                with self._condition:
+                    self._metrics["rate_wait_ms"] += round(waited * 1000)
+                    self._metrics["successes"] += int(succeeded)
+
+            delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            with self._condition:
+                self._metrics["retries"] += 1
+                self._metrics["throttles"] += int(throttled)
+                self._metrics["backoff_ms"] += round(delay * 1000)
+            increment_span_attribute("retries")
+            logger.warning(f"Bedrock call failed ({error}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def metrics(self) -> dict:
+        with self._condition:
+            return dict(self._metrics, concurrency_limit=round(self.concurrency_limit, 2), in_flight=self.in_flight)
+
+
+# Shared by every Bedrock call in the process, so concurrent platform generations respect one set of limits
+bedrock_rate_controller = BedrockRateController(
+    bedrock_requests_per_minute, bedrock_tokens_per_minute, bedrock_max_concurrency,
+    max_attempts=bedrock_max_attempts
+)
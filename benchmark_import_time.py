@@ -0,0 +1,138 @@
+"""
+Cold-start benchmark: how long each module takes to import in a fresh interpreter, and what a
+Lambda cold start pays before the handler does any work.
+
+Every measurement runs in a new Python process (as a cold start would), repeated --repeat times,
+and the median is reported. Import costs come from `python -X importtime` and are cumulative,
+so a module's figure includes everything it imports that wasn't already loaded.
+
+    python benchmark_import_time.py [--repeat 5] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# The pipeline's own modules, then the third-party packages that dominate cold starts
+modules = [
+    "news_to_social_media",
+    "platform_summary_functions",
+    "feed_functions",
+    "aws_functions",
+    "post_history_functions",
+    "image_functions",
+    "http_functions",
+    "facebook_functions",
+    "x_functions",
+    "linkedin_functions",
+    "boto3",
+    "feedparser",
+    "requests",
+    "facebook",
+    "tweepy",
+]
+
+# Heavy packages that should not be loaded just by importing the handler
+lazy_packages = ["boto3", "botocore", "requests", "facebook", "tweepy", "linkedin_functions", "http.server"]
+
+# Steps a cold start can pay for, each timed from interpreter start-up to the end of the snippet
+scenarios = {
+    "interpreter only": "pass",
+    "import handler": "import news_to_social_media",
+    "import handler + Bedrock client": (
+        "import news_to_social_media; from aws_functions import get_client; get_client('bedrock-runtime')"
+    ),
+    "import handler + all platform SDKs": (
+        "import news_to_social_media, facebook_functions, x_functions, linkedin_functions"
+    ),
+}
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(args, env=None) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + args, cwd=here, capture_output=True, text=True,
+                          env=dict(os.environ, **(env or {})))
+
+
+def import_time_us(module: str) -> int:
+    """Cumulative import time of the module in a fresh interpreter, in microseconds, or None if it fails."""
+    result = _run(["-X", "importtime", "-c", f"import {module}"])
+    if result.returncode != 0:
+        return None
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    return None
+
+
+def scenario_ms(snippet: str) -> float:
+    """Wall time of a fresh interpreter running the snippet, in milliseconds."""
+    started = time.perf_counter()
+    # An empty profile name keeps boto3 from looking for the local 'tradesales' profile
+    result = _run(["-c", snippet], env={"AWS_PROFILE_NAME": ""})
+    elapsed = (time.perf_counter() - started) * 1000
+    return elapsed if result.returncode == 0 else None
+
+
+def loaded_lazy_packages() -> list:
+    """The heavy packages that importing the handler loads anyway (should be empty)."""
+    check = f"import sys, news_to_social_media; print(','.join(m for m in {lazy_packages!r} if m in sys.modules))"
+    result = _run(["-c", check])
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+def _median(values):
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def run(repeat: int) -> dict:
+    return {
+        "imports_ms": {
+            module: (lambda us: round(us / 1000, 1) if us is not None else None)(
+                _median([import_time_us(module) for _ in range(repeat)])
+            )
+            for module in modules
+        },
+        "cold_start_ms": {
+            name: (lambda ms: round(ms, 1) if ms is not None else None)(
+                _median([scenario_ms(snippet) for _ in range(repeat)])
+            )
+            for name, snippet in scenarios.items()
+        },
+        "eagerly_loaded": loaded_lazy_packages(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Median of {args.repeat} fresh interpreters\n")
+    print(f"{'module':<32}{'import ms':>12}")
+    for module, ms in results["imports_ms"].items():
+        print(f"{module:<32}{'failed' if ms is None else ms:>12}")
+
+    print(f"\n{'cold start':<40}{'wall ms':>12}")
+    for name, ms in results["cold_start_ms"].items():
+        print(f"{name:<40}{'failed' if ms is None else ms:>12}")
+
+    eager = results["eagerly_loaded"]
+    print(f"\nHeavy packages loaded by importing the handler: {', '.join(eager) if eager else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
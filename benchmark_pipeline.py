@@ -0,0 +1,268 @@
+"""
+Offline end-to-end benchmark of lambda_handler.
+
+Replays the RSS fixtures in benchmark_fixtures/ (one per entry in news_to_social_media.feed_urls)
+from a local server, answers Bedrock with FakeBedrockClient, Secrets Manager with an in-memory
+fake, and the Graph API, X and LinkedIn with local HTTP servers (see fake_backends). No network
+access or AWS credentials are needed.
+
+Every combination of --feeds, --items, --platform-workers and --feed-workers is run --runs times
+after a warm-up run. Feeds beyond the four fixtures are copies with their own GUIDs and images.
+For each combination the harness reports p50/p95/mean handler latency, runs per second and news
+items processed per second.
+
+    python benchmark_pipeline.py --feeds 4 20 50 200 --items 8 25 --runs 5 --json results.json
+    python benchmark_pipeline.py --compare results.json   # same matrix, with deltas against a saved run
+    python benchmark_pipeline.py --record                 # refresh the fixtures from the live feeds
+"""
+import argparse
+import email.utils
+import html
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import urllib.request
+
+# Keep boto3 away from the local 'tradesales' profile; everything AWS is faked
+os.environ.setdefault("AWS_PROFILE_NAME", "")
+
+import feedparser
+
+import aws_functions
+import feed_functions
+import news_to_social_media
+import platform_summary_functions
+from fake_backends import (FakeBedrockClient, FakePlatformServer, FakeSecretsManagerClient, fake_post_response,
+                           route_hosts_to)
+from response_cache_functions import ResponseCache
+
+here = os.path.dirname(os.path.abspath(__file__))
+fixtures_dir = os.path.join(here, "benchmark_fixtures")
+
+# Live feed -> recorded fixture
+fixture_files = {
+    "https://www.autoexpress.co.uk/feed/all": "autoexpress.xml",
+    "https://www.am-online.com/news/latest-news/rss.xml": "am-online.xml",
+    "https://www.fleetnews.co.uk/news/latest-fleet-news/rss.xml": "fleetnews.xml",
+    "https://cardealermagazine.co.uk/publish/category/latest-news/feed": "cardealermagazine.xml",
+}
+
+platform_hosts = ["graph.facebook.com", "api.twitter.com", "api.linkedin.com"]
+
+fake_secrets = {
+    "TwitterAPICredentials": {
+        "APIKey": "fake", "APIKeySecret": "fake", "AccessToken": "fake", "AccessTokenSecret": "fake",
+        "BearerToken": "fake"
+    },
+    "FacebookCredentials": {
+        "AccessToken": "fake-user-token", "AccessTokenExpiry": "2099-01-01T00:00:00+00:00",
+        "AppId": "1", "AppSecret": "fake", "InstagramPageId": "17841400000000000"
+    },
+    "LinkedInCredentials": {
+        "client_id": "fake", "client_secret": "fake", "redirect_uri": "http://localhost/callback",
+        "access_token": "fake", "token_expiry": "2099-01-01T00:00:00+00:00", "refresh_token": "fake"
+    },
+}
+
+
+def record_fixtures():
+    """Download the live feeds into benchmark_fixtures/."""
+    for feed_url, filename in fixture_files.items():
+        request = urllib.request.Request(feed_url, headers={"User-Agent": "socials-benchmark"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            body = response.read()
+        with open(os.path.join(fixtures_dir, filename), "wb") as f:
+            f.write(body)
+        print(f"Recorded {feed_url} ({len(body)} bytes) -> {filename}")
+
+
+def load_fixtures() -> list:
+    """(channel title, entries) for each fixture, entries as plain dicts."""
+    fixtures = []
+    for filename in fixture_files.values():
+        feed = feedparser.parse(os.path.join(fixtures_dir, filename))
+        entries = [{
+            "title": entry.get("title", ""),
+            "description": entry.get("description", ""),
+            "link": entry.get("link", ""),
+        } for entry in feed.entries]
+        fixtures.append((feed.feed.get("title", filename), entries))
+    return fixtures
+
+
+def render_rss(title: str, entries: list) -> bytes:
+    items = []
+    for entry in entries:
+        items.append(
+            "<item>"
+            f"<title>{html.escape(entry['title'])}</title>"
+            f"<link>{html.escape(entry['link'])}</link>"
+            f"<guid isPermaLink=\"false\">{html.escape(entry['guid'])}</guid>"
+            f"<pubDate>{entry['published']}</pubDate>"
+            f"<description>{html.escape(entry['description'])}</description>"
+            f"<media:content url=\"{html.escape(entry['image'])}\" medium=\"image\" type=\"image/jpeg\"/>"
+            "</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>'
+        f"<title>{html.escape(title)}</title>{''.join(items)}</channel></rss>"
+    ).encode("utf-8")
+
+
+def build_feeds(server: FakePlatformServer, fixtures: list, feed_count: int, items_per_feed: int) -> list:
+    """Serve feed_count feeds of items_per_feed items each, cycling through the fixtures. Returns their URLs."""
+    server.feeds = {}
+    urls = []
+    now = time.time()
+    for feed_index in range(feed_count):
+        title, fixture_entries = fixtures[feed_index % len(fixtures)]
+        entries = []
+        for item_index, entry in zip(range(items_per_feed), itertools.cycle(fixture_entries)):
+            entries.append(dict(
+                entry,
+                guid=f"{entry['link']}#feed-{feed_index}-item-{item_index}",
+                published=email.utils.formatdate(now - item_index * 1800 - feed_index * 60),
+                image=f"{server.url}/images/{feed_index}-{item_index}.jpg"
+            ))
+
+        path = f"/feeds/{feed_index}/{list(fixture_files.values())[feed_index % len(fixture_files)]}"
+        server.feeds[path] = render_rss(title, entries)
+        urls.append(server.url + path)
+    return urls
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_once() -> tuple:
+    """One handler invocation with a cold model response cache. Returns (ms, response body)."""
+    platform_summary_functions.response_cache = ResponseCache()
+    started = time.perf_counter()
+    response = news_to_social_media.lambda_handler({}, None)
+    elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, json.loads(response["body"]) if response else {}
+
+
+def run_config(server, fixtures, feed_count, items_per_feed, platform_workers, feed_workers, runs) -> dict:
+    news_to_social_media.default_tenant.feed_urls = build_feeds(server, fixtures, feed_count, items_per_feed)
+    news_to_social_media.platform_max_workers = platform_workers
+    feed_functions.feed_max_workers = feed_workers
+
+    run_once()  # warm-up: imports, clients, connections
+    timings = []
+    failures = 0
+    stages = {}
+    for _ in range(runs):
+        elapsed, body = run_once()
+        timings.append(elapsed)
+        failures += sum(not result["success"] for result in body.get("platforms", {}).values())
+        for stage, values in body.get("run", {}).get("stages", {}).items():
+            stages.setdefault(stage, []).append(values["total_ms"])
+
+    total_seconds = sum(timings) / 1000
+    return {
+        "feeds": feed_count,
+        "items_per_feed": items_per_feed,
+        "platform_workers": platform_workers,
+        "feed_workers": feed_workers,
+        "runs": runs,
+        "p50_ms": round(percentile(timings, 0.5), 1),
+        "p95_ms": round(percentile(timings, 0.95), 1),
+        "mean_ms": round(statistics.mean(timings), 1),
+        "runs_per_s": round(runs / total_seconds, 2),
+        "items_per_s": round(runs * feed_count * items_per_feed / total_seconds, 1),
+        "platform_failures": failures,
+        "stage_mean_ms": {stage: round(statistics.mean(values), 1) for stage, values in stages.items()},
+    }
+
+
+def config_key(result: dict) -> tuple:
+    return result["feeds"], result["items_per_feed"], result["platform_workers"], result["feed_workers"]
+
+
+def print_results(results: list, baseline: list = None):
+    baseline = {config_key(result): result for result in baseline or []}
+    header = f"{'feeds':>6}{'items':>7}{'plat':>6}{'feedw':>7}{'p50 ms':>10}{'p95 ms':>10}{'runs/s':>9}{'items/s':>10}{'fail':>6}"
+    if baseline:
+        header += f"{'p50 vs base':>14}"
+    print(header)
+    for result in results:
+        line = (f"{result['feeds']:>6}{result['items_per_feed']:>7}{result['platform_workers']:>6}"
+                f"{result['feed_workers']:>7}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['runs_per_s']:>9}"
+                f"{result['items_per_s']:>10}{result['platform_failures']:>6}")
+        base = baseline.get(config_key(result))
+        if base:
+            line += f"{(result['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100:>+13.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feeds", type=int, nargs="+", default=[4, 20, 50, 200])
+    parser.add_argument("--items", type=int, nargs="+", default=[8, 25], help="items per feed")
+    parser.add_argument("--platform-workers", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--feed-workers", type=int, nargs="+", default=[8])
+    parser.add_argument("--platforms", default="x,facebook,instagram,linkedin")
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per combination")
+    parser.add_argument("--bedrock-latency", type=float, default=0.5, help="seconds per model call")
+    parser.add_argument("--output-chars", type=int, default=600, help="length of each generated post")
+    parser.add_argument("--platform-latency", type=float, default=0.05, help="seconds per fake API/feed request")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run to compare against")
+    parser.add_argument("--record", action="store_true", help="download the live feeds into the fixtures and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures()
+        return
+
+    server = FakePlatformServer(latency=args.platform_latency).start()
+    try:
+        aws_functions.register_client("bedrock-runtime", FakeBedrockClient(
+            [lambda payload: fake_post_response(payload, args.output_chars)], latency=args.bedrock_latency
+        ))
+        aws_functions.register_client("secretsmanager", FakeSecretsManagerClient(fake_secrets))
+        route_hosts_to(server.url, platform_hosts)
+
+        news_to_social_media.log_level = "WARNING"
+        news_to_social_media.default_tenant.platforms = [p for p in args.platforms.split(",") if p]
+
+        fixtures = load_fixtures()
+        results = []
+        for feed_count, items, platform_workers, feed_workers in itertools.product(
+                args.feeds, args.items, args.platform_workers, args.feed_workers):
+            result = run_config(server, fixtures, feed_count, items, platform_workers, feed_workers, args.runs)
+            results.append(result)
+            print(f"feeds={feed_count} items={items} platform_workers={platform_workers} "
+                  f"feed_workers={feed_workers}: p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms",
+                  file=sys.stderr)
+    finally:
+        server.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    main()
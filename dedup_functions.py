@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from aws_functions import batch_write_items, from_dynamodb_item, get_client, to_dynamodb_item
+from news_item_functions import NewsItem
+
+logger = logging.getLogger()
+
+seen_story_ttl = int(os.environ.get("SEEN_STORY_TTL_DAYS", "14")) * 24 * 60 * 60
+seen_stories_table_name = "seen_stories"
+
+# BatchGetItem accepts at most 100 keys per request
+batch_get_limit = 100
+batch_get_max_attempts = 5
+
+tracking_params = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "cmpid")
+
+
+def normalise_url(url: str) -> str:
+    """Lower-case the scheme/host and drop fragments, tracking parameters and trailing slashes."""
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith(tracking_params)
+    ))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def story_key(item: NewsItem) -> str:
+    """Stable hash identifying a story, from its guid, then link, then title."""
+    if item.guid:
+        identity = "guid:" + item.guid.strip()
+    elif item.link:
+        identity = "link:" + normalise_url(item.link)
+    else:
+        identity = "title:" + re.sub(r"\s+", " ", item.title or item.text).strip().lower()
+
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+
+class SeenStoryIndex:
+    """
+    Index of stories that have already been posted.
+
+    Keys found or written during this process are remembered in memory, so only unknown keys
+    go to DynamoDB, and those are looked up with BatchGetItem. Entries expire through the
+    table's 'ExpiresAt' TTL. A namespace (e.g. a tenant name) keeps separate indexes in the
+    same table; the default, empty namespace stores the bare story keys.
+    """
+
+    def __init__(self, table_name: str = seen_stories_table_name, ttl: int = seen_story_ttl, namespace: str = ""):
+        self.table_name = table_name
+        self.ttl = ttl
+        self.namespace = namespace
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def _stored_key(self, key: str) -> str:
+        return f"{self.namespace}#{key}" if self.namespace else key
+
+    def seen_keys(self, items) -> set:
+        """Return the story keys of the items that have been seen before."""
+        keys = list(dict.fromkeys(story_key(item) for item in items))
+
+        with self._lock:
+            seen = {key for key in keys if key in self._seen}
+        unknown = [key for key in keys if key not in seen]
+
+        dynamodb = get_client('dynamodb')
+        now = time.time()
+        for start in range(0, len(unknown), batch_get_limit):
+            request = {
+                self.table_name: {
+                    'Keys': [
+                        to_dynamodb_item({'StoryKey': self._stored_key(key)})
+                        for key in unknown[start:start + batch_get_limit]
+                    ],
+                    'ProjectionExpression': 'StoryKey, ExpiresAt'
+                }
+            }
+
+            for attempt in range(batch_get_max_attempts):
+                response = dynamodb.batch_get_item(RequestItems=request)
+
+                for item in map(from_dynamodb_item, response.get('Responses', {}).get(self.table_name, [])):
+                    # DynamoDB TTL deletion is lazy, so skip items that have already expired
+                    if 'ExpiresAt' not in item or int(item['ExpiresAt']) > now:
+                        seen.add(item['StoryKey'].rpartition('#')[2])
+
+                request = response.get('UnprocessedKeys') or {}
+                if not request:
+                    break
+                time.sleep(min(2 ** attempt * 0.05, 1))
+            else:
+                logger.warning(f"Gave up on {len(request[self.table_name]['Keys'])} unprocessed seen-story lookups")
+
+        with self._lock:
+            self._seen.update(seen)
+
+        logger.info(f"{len(seen)} of {len(keys)} stories have been posted before.")
+        return seen
+
+    def filter_unseen(self, items) -> list:
+        """Return the items that haven't been seen before, in their original order."""
+        seen = self.seen_keys(items)
+        return [item for item in items if story_key(item) not in seen]
+
+    def mark_seen(self, items):
+        """Record the items as posted."""
+        keys = set(story_key(item) for item in items)
+        expires_at = int(time.time() + self.ttl)
+
+        batch_write_items(self.table_name, [
+            {'StoryKey': self._stored_key(key), 'SeenAt': int(time.time()), 'ExpiresAt': expires_at} for key in keys
+        ])
+
+        with self._lock:
+            self._seen.update(keys)
+
+
+_seen_story_indexes = {}
+_seen_story_indexes_lock = threading.Lock()
+
+
+def get_seen_story_index(namespace: str = "") -> SeenStoryIndex:
+    """The process-wide index for a namespace, so the keys it remembers carry over to warm invocations."""
+    with _seen_story_indexes_lock:
+        if namespace not in _seen_story_indexes:
+            _seen_story_indexes[namespace] = SeenStoryIndex(namespace=namespace)
+        return _seen_story_indexes[namespace]
@@ -1,65 +1,136 @@
 import json
+import logging
 import os
+import threading
 import facebook
-import requests
-from io import BytesIO
 from aws_functions import save_tokens_to_secrets, get_secret
+from http_functions import get_http_session
+from image_functions import fetch_image, ImageDownloadError
+from token_functions import TokenManager
+from tracing_functions import set_span_attributes, traced
 
-def setup_facebook():
-    # generate a page access token and store
-    secret = get_secret(secret_name="FacebookCredentials")
-    secrets = json.loads(secret)
+logger = logging.getLogger()
 
-    user_access_token = secrets['AccessToken']
-    instagram_page_id = secrets['InstagramPageId']
+# Facebook long-lived user tokens last about 60 days; used when the exchange doesn't say
+facebook_default_token_lifetime = 60 * 24 * 60 * 60
 
-    graph = facebook.GraphAPI(user_access_token)
+
+def get_graph(access_token: str) -> facebook.GraphAPI:
+    """Graph API client on the shared keep-alive session for graph.facebook.com."""
+    return facebook.GraphAPI(access_token, session=get_http_session("graph.facebook.com"))
+
+
+def _extend_facebook_token(secrets):
+    graph = get_graph(secrets['AccessToken'])
 
     # Refresh long lived access token
     new_token_object = graph.extend_access_token(secrets['AppId'], secrets['AppSecret'])
 
-    secrets['AccessToken'] = new_token_object['access_token']
+    logger.info("Facebook access token refreshed")
+
+    # Page tokens are re-resolved from the new user token
+    return (
+        {'AccessToken': new_token_object['access_token'], 'PageAccessTokens': {}},
+        new_token_object.get('expires_in') or facebook_default_token_lifetime
+    )
+
+
+_facebook_token_managers = {}
+_facebook_token_managers_lock = threading.Lock()
+
+
+def get_facebook_token_manager(secret_name: str = "FacebookCredentials") -> TokenManager:
+    # One manager per secret, so tenants and platforms sharing the secret also share its refresh lock
+    with _facebook_token_managers_lock:
+        if secret_name not in _facebook_token_managers:
+            _facebook_token_managers[secret_name] = TokenManager(
+                secret_name=secret_name,
+                refresh=_extend_facebook_token,
+                token_key='AccessToken',
+                expiry_key='AccessTokenExpiry'
+            )
+        return _facebook_token_managers[secret_name]
 
-    print("Tokens saved to AWS Secrets Manager", secrets['AccessToken'])
 
-    # Update token in secrets manager
-    save_tokens_to_secrets(secret_name="FacebookCredentials", tokens=secrets)
+facebook_token_manager = get_facebook_token_manager("FacebookCredentials")
 
-    pages = graph.get_object("me/accounts")
 
-    # Extract the section for 'name': 'Trade Sales'
-    trade_sales_data = next((item for item in pages['data'] if item['name'] == 'Trade Sales'), None)
+@traced()
+def setup_facebook(secret_name: str = "FacebookCredentials", page_name: str = "Trade Sales") -> dict:
+    """
+    Resolve the page access token for the named Facebook page and the linked Instagram account id.
 
-    # print(f"Trade Sales Data: {trade_sales_data}")
+    Returns {"page_access_token", "instagram_page_id"}, which can be passed to post_to_facebook
+    and post_to_instagram. They are also exported as environment variables for callers that
+    don't pass them explicitly.
+    """
+    token_manager = get_facebook_token_manager(secret_name)
 
-    os.environ['FaceBook_PageToken'] = trade_sales_data['access_token']
+    # Runs for both Facebook and Instagram, possibly at the same time, so serialise on the token manager
+    with token_manager.lock:
+        user_access_token = token_manager.get_token()
+
+        secrets = json.loads(get_secret(secret_name=secret_name))
+        instagram_page_id = secrets['InstagramPageId']
+        # Tenants sharing a secret post as different pages, so page tokens are kept per page name
+        page_access_tokens = secrets.get('PageAccessTokens') or {}
+        page_access_token = page_access_tokens.get(page_name)
+
+        if not page_access_token:
+            graph = get_graph(user_access_token)
+            pages = graph.get_object("me/accounts")
+
+            # Extract the section for the page, e.g. 'name': 'Trade Sales'
+            page_data = next((item for item in pages['data'] if item['name'] == page_name), None)
+            if page_data is None:
+                raise ValueError(f"Facebook page '{page_name}' is not managed by the account in {secret_name}")
+
+            # Page tokens issued from a long-lived user token don't expire, so keep it for later runs
+            page_access_token = page_data['access_token']
+            secrets['PageAccessTokens'] = dict(page_access_tokens, **{page_name: page_access_token})
+            # The single cached token of earlier versions doesn't say which page it belongs to
+            secrets.pop('PageAccessToken', None)
+            save_tokens_to_secrets(secret_name=secret_name, tokens=secrets)
+
+    os.environ['FaceBook_PageToken'] = page_access_token
     os.environ['InstagramPageId'] = instagram_page_id
+    return {"page_access_token": page_access_token, "instagram_page_id": instagram_page_id}
 
 
-def post_to_facebook(post_text, image_url):
+@traced()
+def post_to_facebook(post_text, image_url, page_access_token: str = None):
     try:
 
         # Initialize the Graph API object
-        graph = facebook.GraphAPI(os.environ['FaceBook_PageToken'])
-
-        # Download the image
-        response = requests.get(image_url)
-        image_content = BytesIO(response.content)
+        graph = get_graph(page_access_token or os.environ['FaceBook_PageToken'])
 
-        graph.put_photo(image=image_content, message=post_text)
+        # Stream the image to the local image cache, then upload it from disk
+        image = fetch_image(image_url)
+        with open(image['path'], 'rb') as image_content:
+            graph.put_photo(image=image_content, message=post_text)
 
-        print("Successfully posted to Facebook!")
+        set_span_attributes(bytes=image['size'])
+        logger.info("Successfully posted to Facebook!")
     except facebook.GraphAPIError as e:
-        print(f"An error occurred: {str(e)}")
+        logger.error(f"An error occurred: {str(e)}")
+        raise
 
-def post_to_instagram(post_text: str, image_url: str) -> None:
+@traced()
+def post_to_instagram(post_text: str, image_url: str, page_access_token: str = None,
+                      instagram_page_id: str = None) -> None:
     try:
+        instagram_page_id = instagram_page_id or os.environ['InstagramPageId']
+
+        # Instagram fetches the image itself, but check it first (a cache hit if Facebook already used it)
+        image = fetch_image(image_url)
+        if image['content_type'] != 'image/jpeg':
+            raise ImageDownloadError(f"Instagram only accepts JPEG images, got {image['content_type']}")
 
         # Initialize the Graph API object
-        graph = facebook.GraphAPI(os.environ['FaceBook_PageToken'])
+        graph = get_graph(page_access_token or os.environ['FaceBook_PageToken'])
 
         creation_resp = graph.request(
-            path=f"{os.environ['InstagramPageId']}/media",
+            path=f"{instagram_page_id}/media",
             args={
                 "image_url": image_url,  # Must be a publicly accessible image URL
                 "caption": post_text,
@@ -74,18 +145,19 @@ def post_to_instagram(post_text: str, image_url: str) -> None:
 
         # 2) Publish the container
         publish_resp = graph.request(
-            path=f"{os.environ['InstagramPageId']}/media_publish",
+            path=f"{instagram_page_id}/media_publish",
             args={
                 "creation_id": creation_id,
             },
             method="POST"
         )
 
-        print("Successfully posted to Instagram!")
+        logger.info("Successfully posted to Instagram!")
 
         return publish_resp
 
     except facebook.GraphAPIError as e:
-        print(f"An error occurred: {str(e)}")
+        logger.error(f"An error occurred: {str(e)}")
+        raise
 
 
@@ -0,0 +1,465 @@
+import io
+import json
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from text_functions import estimate_tokens
+
+
+class FakeEventStream:
+    """Iterable of Bedrock stream events that can be closed part way through, like botocore's EventStream."""
+
+    def __init__(self, events, first_event_delay: float = 0.0, event_delay: float = 0.0):
+        self.events = events
+        self.first_event_delay = first_event_delay
+        self.event_delay = event_delay
+        self.closed = False
+        self.events_read = 0
+
+    def __iter__(self):
+        for index, event in enumerate(self.events):
+            time.sleep(self.first_event_delay if index == 0 else self.event_delay)
+            if self.closed:
+                return
+            self.events_read += 1
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBedrockClient:
+    """
+    Local stand-in for a bedrock-runtime client, for tests and benchmarks.
+
+    Replies are taken in turn from responses (the last one repeats); each is a string or a
+    callable taking the request payload and returning a string. Latency is simulated per
+    request and per streamed chunk, and every request is recorded in self.requests.
+
+    Throttling can be injected: a request raises ThrottlingException with probability
+    throttle_rate, or whenever more than max_concurrency requests are in flight. Throttled
+    requests are counted in self.throttled and not recorded.
+
+    Content blocks marked with cache_control are treated like Bedrock's prompt cache: the
+    first request with a given prefix reports it as cache_creation_input_tokens and later
+    ones as cache_read_input_tokens.
+    """
+
+    def __init__(self, responses=None, latency: float = 0.0, first_token_latency: float = 0.0,
+                 chunk_latency: float = 0.0, chunk_chars: int = 16, throttle_rate: float = 0.0,
+                 max_concurrency: int = None, seed: int = None):
+        self.responses = list(responses or ['{"Text": "Fake post", "Image": ""}'])
+        self.latency = latency
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.chunk_chars = chunk_chars
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.requests = []
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.cached_prefixes = set()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _begin(self, operation: str):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            throttle = self._random.random() < self.throttle_rate or (
+                self.max_concurrency is not None and self.in_flight > self.max_concurrency)
+            if throttle:
+                self.throttled += 1
+                self.in_flight -= 1
+        if throttle:
+            raise ClientError({
+                "Error": {"Code": "ThrottlingException", "Message": "Too many requests, please wait before trying again."},
+                "ResponseMetadata": {"HTTPStatusCode": 429}
+            }, operation)
+
+    def _end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _reply(self, model_id: str, body: str):
+        payload = json.loads(body)
+        with self._lock:
+            self.requests.append({"modelId": model_id, "payload": payload})
+            response = self.responses[min(len(self.requests) - 1, len(self.responses) - 1)]
+
+        text = response(payload) if callable(response) else response
+        usage = {
+            "input_tokens": estimate_tokens(json.dumps(payload["messages"])),
+            "output_tokens": estimate_tokens(text),
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0
+        }
+
+        # Everything up to the last cache point is the cacheable prefix
+        blocks = [block for message in payload["messages"] if isinstance(message["content"], list)
+                  for block in message["content"]]
+        cache_points = [index for index, block in enumerate(blocks) if "cache_control" in block]
+        if cache_points:
+            prefix = json.dumps([model_id, blocks[:cache_points[-1] + 1]])
+            prefix_tokens = estimate_tokens(prefix)
+            with self._lock:
+                cached = prefix in self.cached_prefixes
+                self.cached_prefixes.add(prefix)
+            usage["cache_read_input_tokens" if cached else "cache_creation_input_tokens"] = prefix_tokens
+            usage["input_tokens"] = max(0, usage["input_tokens"] - prefix_tokens)
+        return text, usage
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self._begin("InvokeModel")
+        try:
+            text, usage = self._reply(modelId, body)
+            time.sleep(self.latency)
+        finally:
+            self._end()
+
+        result = {
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": usage
+        }
+        return {"body": io.BytesIO(json.dumps(result).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        # Only the request itself counts towards concurrency; the stream is read afterwards
+        self._begin("InvokeModelWithResponseStream")
+        try:
+            text, usage = self._reply(modelId, body)
+        finally:
+            self._end()
+
+        start_usage = {key: value for key, value in usage.items() if key != "output_tokens"}
+        messages = [{"type": "message_start", "message": {"usage": start_usage}},
+                    {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}]
+        for start in range(0, len(text), self.chunk_chars):
+            messages.append({
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": text[start:start + self.chunk_chars]}
+            })
+        messages += [{"type": "content_block_stop", "index": 0},
+                     {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                      "usage": {"output_tokens": usage["output_tokens"]}},
+                     {"type": "message_stop"}]
+
+        events = [{"chunk": {"bytes": json.dumps(message).encode("utf-8")}} for message in messages]
+        return {"body": FakeEventStream(events, self.latency + self.first_token_latency, self.chunk_latency)}
+
+
+class FakeSecretsManagerClient:
+    """In-memory stand-in for a secretsmanager client, covering the calls aws_functions makes."""
+
+    def __init__(self, secrets: dict):
+        self.secrets = {name: (json.dumps(value) if isinstance(value, dict) else value, 1)
+                        for name, value in secrets.items()}
+        self._lock = threading.Lock()
+
+    def _value(self, name: str) -> dict:
+        secret, version = self.secrets[name]
+        return {"Name": name, "SecretString": secret, "VersionId": f"{version:032d}"}
+
+    def get_secret_value(self, SecretId, VersionId=None, **kwargs):
+        with self._lock:
+            if SecretId not in self.secrets:
+                raise ClientError({"Error": {"Code": "ResourceNotFoundException", "Message": SecretId}},
+                                  "GetSecretValue")
+            return self._value(SecretId)
+
+    def batch_get_secret_value(self, SecretIdList, **kwargs):
+        with self._lock:
+            return {
+                "SecretValues": [self._value(name) for name in SecretIdList if name in self.secrets],
+                "Errors": [{"SecretId": name, "ErrorCode": "ResourceNotFoundException", "Message": name}
+                           for name in SecretIdList if name not in self.secrets]
+            }
+
+    def put_secret_value(self, SecretId, SecretString, **kwargs):
+        with self._lock:
+            version = self.secrets.get(SecretId, (None, 0))[1] + 1
+            self.secrets[SecretId] = (SecretString, version)
+            return {"Name": SecretId, "VersionId": f"{version:032d}"}
+
+
+class FakeDynamoDBClient:
+    """
+    In-memory stand-in for a dynamodb client, covering the item calls the stores, seen-story index
+    and post history make. key_schemas maps table name -> key attribute names; items are kept
+    in DynamoDB's typed format, as the real client takes and returns them. Queries support
+    equality conditions joined with AND, as get_posts_for_date uses. describe_table and
+    update_table keep just the billing mode and global secondary indexes.
+    """
+
+    def __init__(self, key_schemas: dict, billing_mode: str = "PAY_PER_REQUEST"):
+        self.key_schemas = key_schemas
+        self.tables = {name: {} for name in key_schemas}
+        self.descriptions = {
+            name: {"TableName": name, "BillingModeSummary": {"BillingMode": billing_mode}, "GlobalSecondaryIndexes": []}
+            for name in key_schemas
+        }
+        self.transactions = 0
+        self._lock = threading.Lock()
+
+    def _key(self, table_name: str, item: dict) -> tuple:
+        return tuple(json.dumps(item[attribute], sort_keys=True) for attribute in self.key_schemas[table_name])
+
+    def get_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            item = self.tables[TableName].get(self._key(TableName, Key))
+        return {"Item": item} if item is not None else {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None, **kwargs):
+        with self._lock:
+            key = self._key(TableName, Item)
+            if ConditionExpression and ConditionExpression.startswith("attribute_not_exists") \
+                    and key in self.tables[TableName]:
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "exists"}},
+                                  "PutItem")
+            self.tables[TableName][key] = Item
+        return {}
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        if len(TransactItems) > 100:
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": "Too many items"}},
+                              "TransactWriteItems")
+        with self._lock:
+            puts = [(entry["Put"]["TableName"], entry["Put"]["Item"], entry["Put"].get("ConditionExpression"))
+                    for entry in TransactItems]
+            reasons = [
+                "ConditionalCheckFailed"
+                if condition and condition.startswith("attribute_not_exists")
+                and self._key(table_name, item) in self.tables[table_name] else "None"
+                for table_name, item, condition in puts
+            ]
+            # Like DynamoDB, one failed condition cancels the whole transaction
+            if "ConditionalCheckFailed" in reasons:
+                raise ClientError({
+                    "Error": {"Code": "TransactionCanceledException", "Message": "Transaction cancelled"},
+                    "CancellationReasons": [{"Code": code} for code in reasons]
+                }, "TransactWriteItems")
+            for table_name, item, _ in puts:
+                self.tables[table_name][self._key(table_name, item)] = item
+            self.transactions += 1
+        return {}
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        with self._lock:
+            responses = {
+                table_name: [
+                    self.tables[table_name][self._key(table_name, key)] for key in request["Keys"]
+                    if self._key(table_name, key) in self.tables[table_name]
+                ]
+                for table_name, request in RequestItems.items()
+            }
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                if len(requests) > 25:
+                    raise ClientError({"Error": {"Code": "ValidationException", "Message": "Too many items"}},
+                                      "BatchWriteItem")
+                for request in requests:
+                    item = request["PutRequest"]["Item"]
+                    self.tables[table_name][self._key(table_name, item)] = item
+        return {"UnprocessedItems": {}}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, ExpressionAttributeNames=None,
+              **kwargs):
+        names = ExpressionAttributeNames or {}
+        conditions = []
+        for condition in KeyConditionExpression.split(" AND "):
+            name, _, value = (part.strip() for part in condition.partition("="))
+            conditions.append((names.get(name, name), ExpressionAttributeValues[value]))
+
+        with self._lock:
+            items = [item for item in self.tables[TableName].values()
+                     if all(item.get(name) == value for name, value in conditions)]
+        return {"Items": items}
+
+    def describe_table(self, TableName, **kwargs):
+        with self._lock:
+            return {"Table": json.loads(json.dumps(self.descriptions[TableName]))}
+
+    def update_table(self, TableName, GlobalSecondaryIndexUpdates=(), **kwargs):
+        with self._lock:
+            description = self.descriptions[TableName]
+            for update in GlobalSecondaryIndexUpdates:
+                if "Create" in update:
+                    description["GlobalSecondaryIndexes"].append(dict(update["Create"], IndexStatus="CREATING"))
+            return {"TableDescription": json.loads(json.dumps(description))}
+
+
+def fake_post_response(payload: dict, text_chars: int = 600) -> str:
+    """
+    A valid model reply for whichever prompt the payload carries: a tweet thread, a single
+    platform's post, or the combined multi-platform object. Posts use the first image URL in
+    the prompt and are padded to about text_chars characters, to control output tokens.
+    """
+    content = payload["messages"][0]["content"]
+    prompt = content if isinstance(content, str) else "\n".join(block["text"] for block in content)
+
+    images = [line.split("Image:", 1)[1].strip() for line in prompt.splitlines() if line.strip().startswith("Image:")]
+    image = next((url for url in images if url.startswith("http")), "")
+    text = ("Fake post about the latest automotive news. " * (text_chars // 44 + 1))[:text_chars]
+    tweets = [{"tweet": text[:270]}, {"tweet": text[:200]}]
+    post = {"Text": text, "Image": image}
+
+    if "Output a single **valid JSON object**" in prompt:
+        keys = [key for key in ("x", "facebook", "instagram", "linkedin") if f'"{key}"' in prompt]
+        return json.dumps({key: tweets if key == "x" else post for key in keys})
+    if "thread of tweets" in prompt:
+        return json.dumps(tweets)
+    if "Output only the chosen URL" in prompt:
+        return image
+    return json.dumps(post)
+
+
+class FakePlatformServer:
+    """
+    Local HTTP server standing in for the Graph API, X, LinkedIn, the news feeds and their images.
+
+    Feeds are served from self.feeds (path -> RSS bytes) with ETag/304 support, any path under
+    /images/ returns a small JPEG, and the platform endpoints the pipeline calls return canned
+    JSON. Every response waits `latency` seconds, and each path is counted in self.requests.
+    Use route_hosts_to() to send requests for the real API hosts here.
+    """
+
+    def __init__(self, latency: float = 0.0, page_name: str = "Trade Sales", image_size: int = 32 * 1024):
+        self.latency = latency
+        self.page_name = page_name
+        # JPEG start/end markers around padding: enough for content-type and size checks, never decoded
+        self.image_bytes = b"\xff\xd8\xff\xe0" + bytes(max(0, image_size - 6)) + b"\xff\xd9"
+        self.feeds = {}
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        platform_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes = b"", content_type: str = "application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                path = self.path.split("?", 1)[0]
+                platform_server._count(path)
+                time.sleep(platform_server.latency)
+
+                status, body, content_type, headers = platform_server.respond(self.command, path, self.headers)
+                self._send(status, body, content_type, headers)
+
+            do_GET = _handle
+            do_POST = _handle
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-platforms", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _count(self, path: str):
+        key = "/images/" if path.startswith("/images/") else path
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def respond(self, method: str, path: str, headers) -> tuple:
+        """(status, body, content type, extra headers) for a request."""
+        if path in self.feeds:
+            feed = self.feeds[path]
+            etag = '"' + str(hash(feed)) + '"'
+            if headers.get("If-None-Match") == etag:
+                return 304, b"", "application/rss+xml", {"ETag": etag}
+            return 200, feed, "application/rss+xml", {"ETag": etag}
+        if path.startswith("/images/"):
+            return 200, self.image_bytes, "image/jpeg", None
+
+        def reply(value):
+            return 200, json.dumps(value).encode("utf-8"), "application/json", None
+
+        # Graph API
+        if path.endswith("/oauth/access_token"):
+            return reply({"access_token": "fake-user-token", "expires_in": 5184000})
+        if path.endswith("/me/accounts"):
+            return reply({"data": [{"name": self.page_name, "access_token": "fake-page-token", "id": "1"}]})
+        if path.endswith("/photos") or path.endswith("/media") or path.endswith("/media_publish"):
+            return reply({"id": str(time.time_ns())})
+        # X
+        if path == "/2/tweets":
+            return 201, json.dumps({"data": {"id": str(time.time_ns()), "text": ""}}).encode("utf-8"), \
+                "application/json", None
+        # LinkedIn
+        if path == "/v2/userinfo":
+            return reply({"sub": "fake-member"})
+        if path == "/v2/ugcPosts":
+            return 201, json.dumps({"id": f"urn:li:share:{time.time_ns()}"}).encode("utf-8"), "application/json", None
+
+        return 404, json.dumps({"error": {"message": f"No fake for {method} {path}"}}).encode("utf-8"), \
+            "application/json", None
+
+
+def route_hosts_to(base_url: str, hosts) -> dict:
+    """
+    Send every request through http_functions' shared sessions for the given hosts to base_url
+    instead, keeping the path and query. Returns the sessions that were replaced, for restoring.
+    """
+    from urllib.parse import urlsplit, urlunsplit
+
+    import http_functions
+
+    target = urlsplit(base_url)
+
+    class HostRewriteAdapter(http_functions.TimeoutHTTPAdapter):
+        def send(self, request, **kwargs):
+            parts = urlsplit(request.url)
+            request.url = urlunsplit((target.scheme, target.netloc, parts.path, parts.query, parts.fragment))
+            return super().send(request, **kwargs)
+
+    replaced = {}
+    with http_functions._sessions_lock:
+        for host in hosts:
+            session = http_functions.build_http_session()
+            adapter = HostRewriteAdapter(pool_maxsize=http_functions.http_pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            replaced[host] = http_functions._sessions.get(host)
+            http_functions._sessions[host] = session
+    return replaced
@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import feedparser
+from feedparser import FeedParserDict
+
+from tracing_functions import span, tracer
+
+logger = logging.getLogger()
+
+# Concurrency and time limits for the feed ingestion stage, overridable per deployment
+feed_max_workers = int(os.environ.get("FEED_MAX_WORKERS", "8"))
+feed_timeout = float(os.environ.get("FEED_TIMEOUT_SECONDS", "15"))
+feed_total_timeout = float(os.environ.get("FEED_TOTAL_TIMEOUT_SECONDS", "45"))
+
+# Entry fields kept in the feed cache; everything else feedparser produces is dropped to keep records small
+cached_entry_fields = ("id", "link", "title", "description", "published", "published_parsed", "media_content")
+
+
+def _serialise_entry(entry) -> dict:
+    record = {field: entry[field] for field in cached_entry_fields if field in entry}
+    if record.get("published_parsed"):
+        record["published_parsed"] = list(record["published_parsed"])
+    return record
+
+
+def _deserialise_entry(record: dict) -> FeedParserDict:
+    entry = FeedParserDict(record)
+    if entry.get("published_parsed"):
+        entry["published_parsed"] = time.struct_time(entry["published_parsed"])
+    return entry
+
+
+_feed_session = None
+_feed_session_lock = threading.Lock()
+
+
+def _get_feed_session():
+    """Keep-alive session shared by every feed. Without retries, so a download never outlasts its timeout."""
+    global _feed_session
+    with _feed_session_lock:
+        if _feed_session is None:
+            from http_functions import build_http_session  # requests is only imported once a feed is fetched
+
+            _feed_session = build_http_session(max_retries=0)
+        return _feed_session
+
+
+def _download(feed_url: str, timeout: float, etag: str = None, modified: str = None) -> FeedParserDict:
+    """
+    Download a feed, giving up after timeout seconds, and parse it. feedparser's own downloader
+    has no socket timeout, so a stalled server would hold the fetching thread indefinitely.
+    """
+    from http_functions import http_connect_timeout
+
+    deadline = time.monotonic() + timeout
+    headers = {"User-Agent": feedparser.USER_AGENT, "Accept": feedparser.http.ACCEPT_HEADER}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+
+    with _get_feed_session().get(feed_url, headers=headers, stream=True,
+                                 timeout=(min(http_connect_timeout, timeout), timeout)) as response:
+        if response.status_code == 304:
+            return FeedParserDict(bozo=False, status=304, href=response.url, feed=FeedParserDict(), entries=[])
+        response.raise_for_status()
+
+        # The read timeout applies to each read, so also bound the whole body by the deadline
+        chunks = []
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Feed download took longer than {timeout}s")
+            chunks.append(chunk)
+
+    feed = feedparser.parse(b"".join(chunks), response_headers={
+        "content-type": response.headers.get("Content-Type", ""),
+        "content-location": response.url
+    })
+    feed["status"] = response.status_code
+    feed["href"] = response.url
+    feed["etag"] = response.headers.get("ETag")
+    feed["modified"] = response.headers.get("Last-Modified")
+    return feed
+
+
+def _parse(feed_url: str, timeout: float, **validators) -> FeedParserDict:
+    with span("feedparser.parse", feed_url=feed_url) as parse_span:
+        feed = _download(feed_url, timeout, **validators)
+        parse_span.set(status=feed.get("status"), entries=len(feed.entries), bozo=bool(feed.bozo))
+        return feed
+
+
+def fetch_feed(feed_url: str, store=None, timeout: float = None):
+    """
+    Fetch and parse a single feed, giving up on the download after timeout seconds
+    (default FEED_TIMEOUT_SECONDS).
+
+    When a store is given, the feed's etag/modified validators and parsed entries are kept in it.
+    The validators are sent back on the next fetch, and on a 304 Not Modified the cached entries
+    are returned instead of re-downloading and re-parsing the feed.
+    """
+    timeout = timeout or feed_timeout
+    if store is None:
+        return _parse(feed_url, timeout)
+
+    try:
+        cached = store.get(feed_url)
+    except Exception as e:
+        logger.warning(f"Feed cache read failed for {feed_url}: {e}")
+        cached = None
+
+    if cached:
+        feed = _parse(feed_url, timeout, etag=cached.get("etag"), modified=cached.get("modified"))
+    else:
+        feed = _parse(feed_url, timeout)
+
+    if cached and feed.get("status") == 304:
+        logger.info(f"Feed not modified, using cached entries: {feed_url}")
+        return FeedParserDict(
+            bozo=False,
+            status=304,
+            href=feed_url,
+            feed=FeedParserDict(),
+            entries=[_deserialise_entry(entry) for entry in cached["entries"]]
+        )
+
+    if not feed.bozo and (feed.get("etag") or feed.get("modified")):
+        try:
+            store.put(feed_url, {
+                "etag": feed.get("etag"),
+                "modified": feed.get("modified"),
+                "entries": [_serialise_entry(entry) for entry in feed.entries]
+            })
+        except Exception as e:
+            logger.warning(f"Feed cache write failed for {feed_url}: {e}")
+
+    return feed
+
+
+def fetch_feeds(feed_urls, max_workers: int = None, timeout: float = None, total_timeout: float = None,
+                store=None):
+    """
+    Fetch all feeds concurrently on a bounded thread pool.
+
+    Returns a list of (feed_url, feed) tuples in the same order as feed_urls. Feeds that
+    fail to parse (feed.bozo), raise, or run past their own timeout or the overall run
+    timeout are logged and left out. If a store is given, feeds are fetched with conditional GETs
+    (see fetch_feed).
+    """
+    max_workers = max_workers or feed_max_workers
+    timeout = timeout or feed_timeout
+    total_timeout = total_timeout or feed_total_timeout
+
+    if not feed_urls:
+        return []
+
+    started_at = {}
+    run_deadline = time.monotonic() + total_timeout
+
+    def _fetch(index, feed_url):
+        started_at[index] = time.monotonic()
+        # Downloads give up by the feed's timeout or the end of the run, so none outlives the run
+        return fetch_feed(feed_url, store, max(0.1, min(timeout, run_deadline - started_at[index])))
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(feed_urls)), thread_name_prefix="feed")
+    futures = {executor.submit(tracer.wrap(_fetch), index, feed_url): index for index, feed_url in enumerate(feed_urls)}
+    pending = set(futures)
+    timed_out = set()
+
+    try:
+        while pending:
+            now = time.monotonic()
+            if now >= run_deadline:
+                timed_out.update(pending)
+                break
+
+            # Abandon feeds that have been running longer than their own timeout
+            for future in list(pending):
+                index = futures[future]
+                if index in started_at and now - started_at[index] >= timeout:
+                    pending.discard(future)
+                    timed_out.add(future)
+
+            # Wake up at the earliest point a running feed or the run itself could time out
+            next_deadline = min(
+                [run_deadline] + [started_at[futures[f]] + timeout for f in pending if futures[f] in started_at]
+            )
+            done, pending = wait(pending, timeout=max(0.0, next_deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+    finally:
+        # Don't block the handler on abandoned fetches (they stop at their own timeout), and drop any that never started
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for future, index in futures.items():
+        feed_url = feed_urls[index]
+        if future in timed_out:
+            logger.warning(f"Timed out fetching feed: {feed_url}")
+            continue
+
+        try:
+            feed = future.result(timeout=0)
+        except Exception as e:
+            logger.warning(f"Failed to fetch feed: {feed_url} ({e})")
+            continue
+
+        if feed.bozo:
+            logger.warning(f"Failed to parse feed: {feed_url}")
+            continue
+
+        results.append((feed_url, feed))
+
+    logger.info(f"Fetched {len(results)} of {len(feed_urls)} feeds.")
+    return results
@@ -0,0 +1,86 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+http_pool_connections = int(os.environ.get("HTTP_POOL_CONNECTIONS", "10"))
+http_pool_maxsize = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+http_max_retries = int(os.environ.get("HTTP_MAX_RETRIES", "3"))
+http_backoff_factor = float(os.environ.get("HTTP_BACKOFF_FACTOR", "0.5"))
+http_connect_timeout = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+http_read_timeout = float(os.environ.get("HTTP_READ_TIMEOUT_SECONDS", "30"))
+
+retry_status_codes = (429, 500, 502, 503, 504)
+
+
+class PlatformRetry(Retry):
+    """
+    Retry 429s and 5xx responses with exponential backoff, honouring Retry-After.
+
+    Idempotent methods are also retried after read timeouts and dropped connections. POSTs are
+    only retried on a 429 response, where the request is known not to have been processed;
+    after a 5xx, a read timeout or a dropped connection it may have been, and retrying could
+    publish the same post twice. (Connection failures, where nothing was sent, are retried for
+    every method.)
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST":
+            return status_code == 429 and status_code in (self.status_forcelist or ())
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default (connect, read) timeout to requests sent without one."""
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout or (http_connect_timeout, http_read_timeout)
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def build_http_session(max_retries: int = None) -> requests.Session:
+    """Build a keep-alive session with pooled connections, retries and default timeouts."""
+    retry = PlatformRetry(
+        total=http_max_retries if max_retries is None else max_retries,
+        backoff_factor=http_backoff_factor,
+        status_forcelist=retry_status_codes,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # idempotent methods; PlatformRetry adds POST on 429
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=http_pool_connections,
+        pool_maxsize=http_pool_maxsize,
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# host -> session, kept for the life of the process so warm invocations reuse open connections
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session(host: str) -> requests.Session:
+    """Return the shared session for a host, e.g. 'graph.facebook.com'."""
+    with _sessions_lock:
+        if host not in _sessions:
+            _sessions[host] = build_http_session()
+        return _sessions[host]
+
+
+def http_request(method: str, url: str, **kwargs) -> requests.Response:
+    """Send a request through the shared session for the URL's host."""
+    return get_http_session(urlparse(url).netloc).request(method, url, **kwargs)
@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+
+from tracing_functions import span
+
+logger = logging.getLogger()
+
+image_max_bytes = int(os.environ.get("IMAGE_MAX_BYTES", str(8 * 1024 * 1024)))
+image_connect_timeout = float(os.environ.get("IMAGE_CONNECT_TIMEOUT_SECONDS", "5"))
+image_read_timeout = float(os.environ.get("IMAGE_READ_TIMEOUT_SECONDS", "20"))
+image_chunk_size = 64 * 1024
+image_cache_dir = os.environ.get("IMAGE_CACHE_DIR", "/tmp/socials_images")
+
+allowed_image_types = ("image/jpeg", "image/png", "image/gif", "image/webp")
+
+
+class ImageDownloadError(Exception):
+    pass
+
+
+# image URL -> {"path", "content_type", "size"} for images downloaded this run
+_image_cache = {}
+_image_locks = {}
+_image_cache_lock = threading.Lock()
+
+
+def _image_lock(image_url: str) -> threading.Lock:
+    with _image_cache_lock:
+        return _image_locks.setdefault(image_url, threading.Lock())
+
+
+def fetch_image(image_url: str) -> dict:
+    """
+    Download an image to the local image cache, streaming it in chunks.
+
+    The download is rejected if the content type isn't an image or it grows past image_max_bytes.
+    Each URL is fetched at most once per run; concurrent callers for the same URL wait for the
+    first download and share it.
+    """
+    # requests is only imported once an image is actually needed
+    from http_functions import http_request
+
+    with _image_lock(image_url):
+        cached = _image_cache.get(image_url)
+        if cached is not None and os.path.exists(cached["path"]):
+            logger.info(f"Using cached image: {image_url}")
+            return cached
+
+        os.makedirs(image_cache_dir, exist_ok=True)
+        path = os.path.join(image_cache_dir, hashlib.sha256(image_url.encode('utf-8')).hexdigest())
+        tmp_path = f"{path}.part"
+
+        with span("fetch_image", image_url=image_url) as image_span:
+            try:
+                with http_request("GET", image_url, stream=True,
+                                  timeout=(image_connect_timeout, image_read_timeout)) as response:
+                    response.raise_for_status()
+
+                    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                    if content_type not in allowed_image_types:
+                        raise ImageDownloadError(f"Unsupported content type '{content_type}' for {image_url}")
+
+                    content_length = response.headers.get("Content-Length")
+                    if content_length and content_length.isdigit() and int(content_length) > image_max_bytes:
+                        raise ImageDownloadError(f"Image is {content_length} bytes, over the {image_max_bytes} limit")
+
+                    size = 0
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_content(chunk_size=image_chunk_size):
+                            size += len(chunk)
+                            if size > image_max_bytes:
+                                raise ImageDownloadError(f"Image exceeded the {image_max_bytes} byte limit: {image_url}")
+                            f.write(chunk)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            image_span.set(bytes=size)
+
+        os.replace(tmp_path, path)
+        image = {"path": path, "content_type": content_type, "size": size}
+        _image_cache[image_url] = image
+
+        logger.info(f"Downloaded image ({size} bytes): {image_url}")
+        return image
+
+
+def clear_image_cache():
+    """Forget this run's images and remove their files."""
+    with _image_cache_lock:
+        _image_cache.clear()
+        _image_locks.clear()
+    shutil.rmtree(image_cache_dir, ignore_errors=True)
@@ -1,12 +1,19 @@
 import datetime
 import json
+import logging
 import os
 import string
 import random
+import threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlencode, parse_qs, urlparse, quote
 import requests
 from aws_functions import get_secret, save_tokens_to_secrets
+from http_functions import http_request
+from token_functions import TokenManager, is_token_fresh, parse_expiry
+from tracing_functions import traced
+
+logger = logging.getLogger()
 
 
 class CallbackHandler(BaseHTTPRequestHandler):
@@ -30,29 +37,20 @@ class CallbackHandler(BaseHTTPRequestHandler):
 
 class LinkedInAuth:
 
-    def __init__(self):
+    def __init__(self, secret_name: str = "LinkedInCredentials"):
 
-        secret = get_secret(secret_name="LinkedInCredentials")
+        secret = get_secret(secret_name=secret_name)
         secrets = json.loads(secret)
 
+        self.secret_name = secret_name
         self.client_id = secrets['client_id']
         self.client_secret = secrets['client_secret']
         self.redirect_uri = secrets['redirect_uri']
-        # self.access_token = secrets['access_token']
+        self.access_token = secrets.get('access_token')
+        self.refresh_token = secrets.get('refresh_token')
+        self.token_expiry = secrets.get('token_expiry')
         # self.organisation_urn = secrets['organisation_urn']
 
-    @staticmethod
-    def update_linkedin_credentials(secret_label: str, secret_value: str):
-
-        print("UPDATE LINKEDIN CREDENTIALS RECEIVED ", secret_label, secret_value)
-        secret = get_secret(secret_name="LinkedInCredentials")
-        secrets = json.loads(secret)
-        print("RETRIEVED SECRETS", secrets)
-        secrets[secret_label] = secret_value
-        print("NEW SECRETS", secrets)
-        save_tokens_to_secrets(secret_name="LinkedInCredentials", tokens=secrets)
-        print("CREDENTIALS SAVED", secret_label, secret_value)
-
     def get_authorization_url(self) -> str:
         params = {
             'response_type': 'code',
@@ -74,14 +72,23 @@ class LinkedInAuth:
             'redirect_uri': self.redirect_uri
         }
 
-        response = requests.get(token_url, data=data)
+        response = http_request("GET", token_url, data=data)
 
         token_data = response.json()
 
         access_token:str = token_data['access_token']
 
         if token_data['access_token']:
-            LinkedInAuth.update_linkedin_credentials('access_token', access_token)
+            # Store the token with its expiry (and refresh token, if issued) so it is only refreshed near expiry
+            expires_in = token_data.get('expires_in', 5184000)
+            secrets = json.loads(get_secret(secret_name=self.secret_name))
+            secrets['access_token'] = access_token
+            secrets['token_expiry'] = (
+                datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expires_in)
+            ).isoformat()
+            if token_data.get('refresh_token'):
+                secrets['refresh_token'] = token_data['refresh_token']
+            save_tokens_to_secrets(secret_name=self.secret_name, tokens=secrets)
 
         return access_token
 
@@ -92,32 +99,15 @@ class LinkedInAuth:
         Returns:
             bool: True if token exists and hasn't expired, False otherwise
         """
-        # Check if we have a token and expiry time
-        if not self.access_token or not self.token_expiry:
-            return False
-
-        # If token_expiry is a string (from JSON), convert it to datetime
-        if isinstance(self.token_expiry, str):
-            try:
-                self.token_expiry = datetime.datetime.fromisoformat(self.token_expiry)
-            except ValueError:
-                return False
-
-        # Check if token has expired
-        return datetime.datetime.now() < self.token_expiry
+        return is_token_fresh(self.access_token, self.token_expiry, window=datetime.timedelta(0))
 
     def refresh_access_token(self) -> dict:
         """Refresh the access token using the refresh token."""
         # Check if we have a refresh token
         if not self.refresh_token:
-            print("No refresh token available. Need to perform initial authorization.")
-            # Perform initial authorization
-            token_data = perform_initial_auth(
-                client_id=self.client_id,
-                client_secret=self.client_secret,
-                redirect_uri=self.redirect_uri
+            raise RuntimeError(
+                f"No LinkedIn refresh token in {self.secret_name}; run run_this_to_auth_linkedin.py to authorise again"
             )
-            return token_data
 
         try:
             token_url = 'https://www.linkedin.com/oauth/v2/accessToken'
@@ -128,7 +118,7 @@ class LinkedInAuth:
                 'client_secret': self.client_secret
             }
 
-            response = requests.post(token_url, data=data)
+            response = http_request("POST", token_url, data=data)
             response.raise_for_status()
             token_data = response.json()
 
@@ -136,38 +126,82 @@ class LinkedInAuth:
             self.access_token = token_data['access_token']
             self.refresh_token = token_data.get('refresh_token', self.refresh_token)
             expires_in = token_data.get('expires_in', 5184000)
-            self.token_expiry = datetime.datetime.now() + datetime.timedelta(seconds=expires_in)
+            self.token_expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expires_in)
 
             return {
                 "access_token": self.access_token,
                 "refresh_token": self.refresh_token,
-                "token_expiry": self.token_expiry.isoformat()
+                "token_expiry": self.token_expiry.isoformat(),
+                "expires_in": expires_in
             }
 
         except requests.exceptions.RequestException as e:
-            print(f"Error refreshing token: {str(e)}")
+            logger.error(f"Error refreshing token: {str(e)}")
             if hasattr(e, 'response') and hasattr(e.response, 'text'):
-                print(f"Response content: {e.response.text}")
-
-            # If refresh fails, try initial authorization
-            print("Attempting initial authorization...")
-            token_data = perform_initial_auth(
-                client_id=self.client_id,
-                client_secret=self.client_secret,
-                redirect_uri=self.redirect_uri
-            )
-            return token_data
+                logger.error(f"Response content: {e.response.text}")
+
+            raise RuntimeError(
+                f"Refreshing the LinkedIn token in {self.secret_name} failed; "
+                f"run run_this_to_auth_linkedin.py to authorise again"
+            ) from e
+
+
+def _refresh_linkedin_token(secret_name: str, secrets: dict):
+    """
+    Refresh the stored LinkedIn token. LinkedIn rarely issues refresh tokens, and older secrets have
+    no token_expiry, so when the token can't be refreshed but isn't known to have expired, the
+    stored token is kept (None) rather than failing the post.
+    """
+    expiry = parse_expiry(secrets.get('token_expiry'))
+    may_still_work = bool(secrets.get('access_token')) and (
+        expiry is None or expiry > datetime.datetime.now(datetime.timezone.utc)
+    )
+
+    if not secrets.get('refresh_token'):
+        if may_still_work:
+            logger.warning(f"No LinkedIn refresh token in {secret_name}; using the stored access token")
+            return None
+        raise RuntimeError(
+            f"The LinkedIn token in {secret_name} has expired and there is no refresh token; "
+            f"run run_this_to_auth_linkedin.py to authorise again"
+        )
+
+    try:
+        token_data = LinkedInAuth(secret_name).refresh_access_token()
+    except Exception as e:
+        if not may_still_work:
+            raise
+        logger.warning(f"{e}; using the stored access token")
+        return None
 
+    return (
+        {'access_token': token_data['access_token'], 'refresh_token': token_data['refresh_token']},
+        token_data['expires_in']
+    )
 
-def post_to_linkedin(text: str, image_url: str, secret_name: str = "LinkedInCredentials") -> dict:
 
-    """Post content to LinkedIn with automatic token refresh."""
-    # Load credentials and tokens
-    secrets = json.loads(get_secret(secret_name))
+_linkedin_token_managers = {}
+_linkedin_token_managers_lock = threading.Lock()
+
+
+def get_linkedin_token_manager(secret_name: str = "LinkedInCredentials") -> TokenManager:
+    # One manager per secret, so tenants sharing the secret also share its refresh lock
+    with _linkedin_token_managers_lock:
+        if secret_name not in _linkedin_token_managers:
+            _linkedin_token_managers[secret_name] = TokenManager(
+                secret_name=secret_name,
+                refresh=lambda secrets: _refresh_linkedin_token(secret_name, secrets)
+            )
+        return _linkedin_token_managers[secret_name]
+
 
-    access_token = secrets.get('access_token')
+@traced()
+def post_to_linkedin(text: str, image_url: str, secret_name: str = "LinkedInCredentials",
+                     organisation_urn: str = "urn:li:organization:104956250") -> dict:
 
-    #print(f"Bearer: {access_token}")
+    """Post content to LinkedIn with automatic token refresh."""
+    # Load the access token, refreshing it first if it is close to expiry
+    access_token = get_linkedin_token_manager(secret_name).get_token()
 
     headers = {
         'Authorization': f'Bearer {access_token}',
@@ -177,17 +211,14 @@ def post_to_linkedin(text: str, image_url: str, secret_name: str = "LinkedInCred
 
     try:
         # Get user profile ID
-        profile_response = requests.get(
+        profile_response = http_request(
+            "GET",
             "https://api.linkedin.com/v2/userinfo",
             headers=headers
         )
 
-        #print("PROFILE RESPONSE ", profile_response.json())
-
-        exit(1)
-
         profile_response.raise_for_status()
-        author = f"urn:li:organization:104956250"
+        author = organisation_urn
 
         # Prepare post data
         post_data = {
@@ -207,7 +238,8 @@ def post_to_linkedin(text: str, image_url: str, secret_name: str = "LinkedInCred
         }
 
         # Make the post
-        response = requests.post(
+        response = http_request(
+            "POST",
             "https://api.linkedin.com/v2/ugcPosts",
             headers=headers,
             json=post_data
@@ -216,7 +248,7 @@ def post_to_linkedin(text: str, image_url: str, secret_name: str = "LinkedInCred
         return response.json()
 
     except requests.exceptions.RequestException as e:
-        print(f"Error posting to LinkedIn: {str(e)}")
+        logger.error(f"Error posting to LinkedIn: {str(e)}")
         if hasattr(e, 'response') and hasattr(e.response, 'text'):
-            print(f"Response content: {e.response.text}")
+            logger.error(f"Response content: {e.response.text}")
         return None
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger()
+
+model_routes_path = os.environ.get(
+    "MODEL_ROUTES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_routes.json")
+)
+
+# Bedrock errors after which the request is retried on the route's fallback model
+fallback_error_codes = ("ThrottlingException", "ModelTimeoutException", "ServiceUnavailableException",
+                        "ModelNotReadyException")
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def load_model_routes(path: str = None) -> dict:
+    """Load (once) the declarative route config: default route, per-task overrides and model prices."""
+    global _config
+    with _config_lock:
+        if _config is None or path is not None:
+            with open(path or model_routes_path, "r", encoding="utf-8") as f:
+                _config = json.load(f)
+        return _config
+
+
+def get_route(task: str = None) -> dict:
+    """Route settings for a task (platform name, 'combined', 'repair', ...), merged over the default."""
+    config = load_model_routes()
+    route = dict(config["default"])
+    route.update(config.get("routes", {}).get(task or "default", {}))
+    route["name"] = task or "default"
+    return route
+
+
+def supports_prompt_caching(model_id: str) -> bool:
+    """True if the model accepts cache_control blocks. Cross-region inference profile ids (eu.anthropic...) match too."""
+    return any(model_id == model or model_id.endswith("." + model)
+               for model in load_model_routes().get("prompt_caching_models", []))
+
+
+def is_fallback_error(error: Exception) -> bool:
+    """True for throttling and timeout errors, which a different model may not hit."""
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    if code in fallback_error_codes:
+        return True
+    # botocore's ReadTimeoutError/ConnectTimeoutError
+    return "Timeout" in type(error).__name__
+
+
+class RouteStats:
+    """
+    Per-route call, fallback, latency, token and estimated cost totals for this process.
+
+    Prompt cache reads and writes are priced at 0.1x and 1.25x the model's input price unless
+    the model's prices give cache_read/cache_write explicitly.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, model_id: str, latency_ms: float, usage: dict = None,
+               fallback: bool = False, failed: bool = False):
+        usage = usage or {}
+        input_tokens = usage.get("input_tokens") or 0
+        output_tokens = usage.get("output_tokens") or 0
+        cache_read_tokens = usage.get("cache_read_input_tokens") or 0
+        cache_write_tokens = usage.get("cache_creation_input_tokens") or 0
+        prices = load_model_routes().get("prices_per_million_tokens", {}).get(model_id, {})
+        input_price = prices.get("input", 0)
+        cost = (
+            input_tokens * input_price
+            + output_tokens * prices.get("output", 0)
+            + cache_read_tokens * prices.get("cache_read", input_price * 0.1)
+            + cache_write_tokens * prices.get("cache_write", input_price * 1.25)
+        ) / 1_000_000
+
+        with self._lock:
+            stats = self.routes.setdefault(route, {
+                "calls": 0, "failures": 0, "fallbacks": 0, "latency_ms": 0,
+                "input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0,
+                "cache_creation_input_tokens": 0, "cost_usd": 0.0, "models": {}
+            })
+            stats["calls"] += 1
+            stats["failures"] += int(failed)
+            stats["fallbacks"] += int(fallback)
+            stats["latency_ms"] += round(latency_ms)
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cache_read_input_tokens"] += cache_read_tokens
+            stats["cache_creation_input_tokens"] += cache_write_tokens
+            stats["cost_usd"] = round(stats["cost_usd"] + cost, 6)
+            stats["models"][model_id] = stats["models"].get(model_id, 0) + 1
+
+        logger.info(f"Route {route} via {model_id}: {round(latency_ms)}ms, tokens in/out "
+                    f"{input_tokens}/{output_tokens}, cache read/write {cache_read_tokens}/{cache_write_tokens}, ~${cost:.5f}{' (fallback)' if fallback else ''}")
+
+    def summary(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self.routes))
+
+
+route_stats = RouteStats()
@@ -1,24 +1,82 @@
+import dataclasses
+import datetime
 import logging
+import os
+import time
 import hashlib
-import feedparser
-import boto3
 from feedparser import FeedParserDict
 
 import json
 import platform_summary_functions as psf
 import random
-from facebook_functions import post_to_facebook, setup_facebook, post_to_instagram
-from linkedin_functions import LinkedInAuth, post_to_linkedin
-from x_functions import post_tweet, setup_twitter_vars
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%H:%M:%S'  # Hours:Minutes:Seconds format (no milliseconds)
-)
+from concurrent.futures import ThreadPoolExecutor
+from aws_functions import get_client, preload_secrets, to_dynamodb_item
+from dedup_functions import get_seen_story_index, seen_stories_table_name, story_key
+from feed_functions import fetch_feeds
+from image_functions import clear_image_cache
+from news_item_functions import FeedHighWaterMarks, iter_news_items, newer_than
+from post_parsing_functions import parse_platform_post
+from ranking_functions import select_news_items
+from post_history_functions import PostHistoryWriter, platform_date_index_name
+from queue_functions import QueueMessage, make_queue
+from response_cache_functions import llm_cache_table_name
+from store_functions import make_store
+from tenant_functions import Tenant, load_tenants, parse_tenants, tenant_max_workers
+from tracing_functions import JsonFormatter, span, tracer
+
+# The platform SDKs (facebook-sdk, tweepy, the LinkedIn module and their dependencies) are imported
+# inside the platform handlers, so a run only pays for the platforms it actually posts to. Once
+# imported they stay in sys.modules, along with their cached clients, for warm invocations.
+
 logger = logging.getLogger()
+log_level = os.environ.get('LOG_LEVEL', 'INFO')
+# 'json' for one structured JSON record per line (with run id and span), 'text' for plain messages
+log_format = os.environ.get('LOG_FORMAT', 'text')
 
 table_name = 'social_media_posts'
+feed_cache_table_name = 'feed_cache'
+feed_high_water_table_name = 'feed_high_water'
+
+# Where feed validators and entries are cached between runs: 'dynamodb', 'file' or unset to disable
+feed_cache_backend = os.environ.get('FEED_CACHE_BACKEND', '')
+
+# Where each feed's high-water mark is kept: 'dynamodb', 'file' or unset to read every entry of every feed.
+# With a mark, only entries newer than the ones taken on earlier runs are read.
+feed_high_water_backend = os.environ.get('FEED_HIGH_WATER_BACKEND', '')
+
+# Set to 'dynamodb' to skip stories that were posted on earlier runs
+seen_stories_backend = os.environ.get('SEEN_STORIES_BACKEND', '')
+
+# Set to 'dynamodb' to record each published post in the post history table
+post_history_backend = os.environ.get('POST_HISTORY_BACKEND', '')
+
+# Set to 'sqs' ('sqlite' or 'memory' locally) to queue rendered posts for worker_handler to publish,
+# instead of publishing them within the run
+post_queue_backend = os.environ.get('POST_QUEUE_BACKEND', '')
+post_queue_name = os.environ.get('POST_QUEUE_NAME', 'social-posts')
+post_queue_url = os.environ.get('POST_QUEUE_URL', '')
+post_dead_letter_queue_url = os.environ.get('POST_DEAD_LETTER_QUEUE_URL', '')
+
+# How many queued posts the worker takes at a time, how long they stay hidden from other workers
+# while it publishes them, and how many attempts a post gets (backing off from the retry delay)
+# before it goes to the dead-letter queue
+post_queue_batch_size = int(os.environ.get('POST_QUEUE_BATCH_SIZE', '10'))
+post_queue_visibility_timeout = int(os.environ.get('POST_QUEUE_VISIBILITY_TIMEOUT', '300'))
+post_queue_max_attempts = int(os.environ.get('POST_QUEUE_MAX_ATTEMPTS', '5'))
+post_queue_retry_delay = int(os.environ.get('POST_QUEUE_RETRY_DELAY_SECONDS', '60'))
+# Time a draining worker leaves itself to finish its last batch before Lambda stops it
+post_queue_worker_reserve = int(os.environ.get('POST_QUEUE_WORKER_RESERVE_SECONDS', '60'))
+
+# Platforms to post to, and how many of them may generate/publish at the same time
+enabled_platforms = os.environ.get('ENABLED_PLATFORMS', 'x,facebook,instagram').split(',')
+platform_max_workers = int(os.environ.get('PLATFORM_MAX_WORKERS', '3'))
+
+# 'per_platform' asks the model once per platform; 'combined' generates every platform's post in one call
+generation_mode = os.environ.get('GENERATION_MODE', 'per_platform')
+
+# How many stories go into the prompt, and the most prompt tokens they may use between them
+max_news_items = int(os.environ.get('MAX_NEWS_ITEMS', '20'))
+news_token_budget = int(os.environ.get('NEWS_TOKEN_BUDGET', '6000'))
 
 # define news feed sources
 feed_urls = [
@@ -28,10 +86,27 @@ feed_urls = [
     "https://cardealermagazine.co.uk/publish/category/latest-news/feed"
 ]
 
+# The brand lambda_handler posts for. Its seen stories keep the original, un-namespaced keys.
+default_tenant = Tenant(
+    name="tradesales",
+    feed_urls=feed_urls,
+    platforms=enabled_platforms,
+    facebook_page_name="Trade Sales",
+    linkedin_organisation_urn="urn:li:organization:104956250",
+    story_namespace=""
+)
+
 
-def create_dynamodb_table(table_name):
-    session = boto3.Session(profile_name='tradesales')
-    dynamodb = session.client('dynamodb')
+def create_dynamodb_table(table_name, billing_mode='PROVISIONED'):
+    """Create the post history table. billing_mode is 'PROVISIONED' (5/5 RCU/WCU) or 'PAY_PER_REQUEST'."""
+    dynamodb = get_client('dynamodb')
+
+    provisioned_throughput = {
+        'ReadCapacityUnits': 5,
+        'WriteCapacityUnits': 5
+    }
+
+    platform_date_index = _platform_date_index()
 
     table_definition = {
         'TableName': table_name,
@@ -41,14 +116,17 @@ def create_dynamodb_table(table_name):
         ],
         'AttributeDefinitions': [
             {'AttributeName': 'PostId', 'AttributeType': 'S'},
-            {'AttributeName': 'PostDate', 'AttributeType': 'S'}
+            {'AttributeName': 'PostDate', 'AttributeType': 'S'},
+            {'AttributeName': 'Platform', 'AttributeType': 'S'}
         ],
-        'ProvisionedThroughput': {
-            'ReadCapacityUnits': 5,
-            'WriteCapacityUnits': 5
-        }
+        'GlobalSecondaryIndexes': [platform_date_index],
+        'BillingMode': billing_mode
     }
 
+    if billing_mode == 'PROVISIONED':
+        table_definition['ProvisionedThroughput'] = provisioned_throughput
+        platform_date_index['ProvisionedThroughput'] = provisioned_throughput
+
     try:
         response = dynamodb.create_table(**table_definition)
         # print(f"Table '{table_name}' creation initiated.")
@@ -56,22 +134,134 @@ def create_dynamodb_table(table_name):
         return response
     except dynamodb.exceptions.ResourceInUseException:
         logger.info(f"Table '{table_name}' already exists.")
+        # Tables created before the index existed need it added for get_posts_for_date
+        return add_platform_date_index(table_name)
     except Exception as e:
         logger.error(f"Error creating table: {e}")
 
 
-def insert_item_into_table(post_date, post_id, summary, metadata):
-    session = boto3.Session(profile_name='tradesales')
-    dynamodb = session.resource('dynamodb')
-    table = dynamodb.Table(table_name)
+def _platform_date_index() -> dict:
+    # Lets "what did we post today" be a single query per platform
+    return {
+        'IndexName': platform_date_index_name,
+        'KeySchema': [
+            {'AttributeName': 'Platform', 'KeyType': 'HASH'},
+            {'AttributeName': 'PostDate', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'ALL'}
+    }
+
+
+def add_platform_date_index(table_name=table_name):
+    """Add the platform/date index to an existing post history table, if it doesn't have it yet."""
+    dynamodb = get_client('dynamodb')
+
+    try:
+        table = dynamodb.describe_table(TableName=table_name)['Table']
+        if any(index['IndexName'] == platform_date_index_name for index in table.get('GlobalSecondaryIndexes', [])):
+            logger.info(f"Table '{table_name}' already has the {platform_date_index_name} index.")
+            return None
+
+        platform_date_index = _platform_date_index()
+        # Tables without a billing mode summary predate on-demand billing, so are provisioned
+        if table.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED') == 'PROVISIONED':
+            platform_date_index['ProvisionedThroughput'] = {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+
+        response = dynamodb.update_table(
+            TableName=table_name,
+            AttributeDefinitions=[
+                {'AttributeName': 'Platform', 'AttributeType': 'S'},
+                {'AttributeName': 'PostDate', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexUpdates=[{'Create': platform_date_index}]
+        )
+        logger.info(f"Adding the {platform_date_index_name} index to '{table_name}'; it backfills in the background.")
+        return response
+    except Exception as e:
+        logger.error(f"Error adding the {platform_date_index_name} index: {e}")
+
+
+def create_ttl_table(table_name, key_attribute):
+    """Create an on-demand table with a string partition key and an 'ExpiresAt' TTL attribute."""
+    dynamodb = get_client('dynamodb')
+
+    table_definition = {
+        'TableName': table_name,
+        'KeySchema': [
+            {'AttributeName': key_attribute, 'KeyType': 'HASH'}  # Partition key
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': key_attribute, 'AttributeType': 'S'}
+        ],
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
 
     try:
-        response = table.put_item(Item={
+        response = dynamodb.create_table(**table_definition)
+        logger.info(f"Table '{table_name}' creation initiated.")
+        dynamodb.get_waiter('table_exists').wait(TableName=table_name)
+        dynamodb.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'ExpiresAt'}
+        )
+        return response
+    except dynamodb.exceptions.ResourceInUseException:
+        logger.info(f"Table '{table_name}' already exists.")
+    except Exception as e:
+        logger.error(f"Error creating table: {e}")
+
+
+def create_feed_cache_table(table_name=feed_cache_table_name):
+    return create_ttl_table(table_name, 'CacheKey')  # Keyed by feed URL
+
+
+def create_feed_high_water_table(table_name=feed_high_water_table_name):
+    return create_ttl_table(table_name, 'CacheKey')  # Keyed by feed URL, prefixed by the tenant's namespace
+
+
+def create_seen_stories_table(table_name=seen_stories_table_name):
+    return create_ttl_table(table_name, 'StoryKey')  # Keyed by story_key hash
+
+
+def create_llm_cache_table(table_name=llm_cache_table_name):
+    return create_ttl_table(table_name, 'CacheKey')  # Keyed by make_cache_key hash of the model request
+
+
+def create_post_queues(queue_name=post_queue_name, max_attempts=post_queue_max_attempts):
+    """
+    Create the SQS post queue and its dead-letter queue. SQS moves a post to the dead-letter
+    queue after max_attempts receives, should the worker stop before doing it itself.
+    Returns (queue url, dead-letter queue url).
+    """
+    sqs = get_client('sqs')
+
+    try:
+        dead_letter_url = sqs.create_queue(
+            QueueName=f"{queue_name}-dead-letter",
+            Attributes={'MessageRetentionPeriod': str(14 * 24 * 60 * 60)}  # The longest SQS allows
+        )['QueueUrl']
+        dead_letter_arn = sqs.get_queue_attributes(
+            QueueUrl=dead_letter_url, AttributeNames=['QueueArn']
+        )['Attributes']['QueueArn']
+
+        queue_url = sqs.create_queue(QueueName=queue_name, Attributes={
+            'VisibilityTimeout': str(post_queue_visibility_timeout),
+            'RedrivePolicy': json.dumps({'deadLetterTargetArn': dead_letter_arn, 'maxReceiveCount': str(max_attempts)})
+        })['QueueUrl']
+        logger.info(f"Queue '{queue_name}' ready at {queue_url}, dead letters go to {dead_letter_url}")
+        return queue_url, dead_letter_url
+    except Exception as e:
+        logger.error(f"Error creating queues: {e}")
+
+
+def insert_item_into_table(post_date, post_id, summary, metadata):
+    try:
+        response = get_client('dynamodb').put_item(TableName=table_name, Item=to_dynamodb_item({
             'PostDate': post_date,
             "PostId": post_id,
             "Summary": summary,
             "Metadata": metadata
-        })
+        }))
 
         return response
     except Exception as e:
@@ -79,17 +269,14 @@ def insert_item_into_table(post_date, post_id, summary, metadata):
         return None
 
 
-def get_parsed_feed_items(feed: FeedParserDict):
-    news_items = []
+def get_parsed_feed_items(feed: FeedParserDict, high_water_mark: dict = None):
+    """
+    The feed's entries as NewsItems. With a high-water mark, only the entries newer than it are
+    converted; reading stops once the feed reaches entries taken on an earlier run.
+    """
+    news_items = list(newer_than(iter_news_items(feed.entries), high_water_mark))
 
-    for item in feed.entries:
-        news_item = {
-            "text": item.get("title", "") + "\n\n" + item.get("description", ""),
-            "image_url": item.get("media_content", [{}])[0].get("url", "")  # Extract image if available
-        }
-        news_items.append(news_item)
-
-    logger.info(f"Extracted {len(news_items)} news items.")
+    logger.info(f"Extracted {len(news_items)} of {len(feed.entries)} news items.")
     return news_items
 
 
@@ -100,115 +287,579 @@ def generate_post_id(post_content: str) -> str:
     return post_hash
 
 
-# Example usage:
-def post_to_social_media(news_items):
+def make_post_queue():
+    """The queue rendered posts go through (POST_QUEUE_BACKEND), or None to publish them straight away."""
+    return make_queue(post_queue_backend, post_queue_name, post_queue_url, post_dead_letter_queue_url)
+
+
+def post_message(tenant: Tenant, platform, post, news_items) -> dict:
+    """
+    The queue message for a rendered post: everything the worker needs to publish and record it,
+    including the tenant's config, so posts for tenants that only exist in a batch_handler event
+    can still be published.
+    """
+    return {
+        "post_id": generate_post_id(f"{platform}\n{post['text']}"),
+        "tenant": tenant.name,
+        "tenant_config": dataclasses.asdict(tenant),
+        "platform": platform,
+        "text": post["text"],
+        "image": post["image"],
+        "feeds": tenant.feed_urls,
+        "stories": [item.link for item in news_items if item.link],
+        "rendered_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+
+
+def _run_platform(platform, news_items, content=None, tenant: Tenant = None, queue=None):
+    """
+    Run one platform's generate -> parse -> publish pipeline, or generate -> parse -> enqueue when
+    given a queue, capturing its outcome and timing.
+    """
+    tenant = tenant or default_tenant
+    started = time.perf_counter()
+    try:
+        with span("platform", platform=platform):
+            post = platform_renderers[platform](news_items, content)
+            if queue is None:
+                platform_publishers[platform](post, tenant)
+            else:
+                queue.send([post_message(tenant, platform, post, news_items)])
+        result = {"success": True, "post": post, "queued": queue is not None}
+    except Exception as e:
+        logger.exception(f"Posting to {platform} failed")
+        result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000)
+    logger.info(f"Finished {platform} in {result['duration_ms']}ms (success={result['success']})")
+    return result
+
+
+def post_to_social_media(news_items, platforms=None, max_workers: int = None, mode: str = None,
+                         tenant: Tenant = None, queue=None):
+    """
+    Generate and publish to each platform concurrently, as the tenant (default: default_tenant).
+
+    In 'combined' mode every platform's post is generated up front in a single model call and
+    the platform pipelines only parse and publish. Given a queue, the rendered posts are
+    enqueued for worker_handler instead of published. A failure on one platform does not affect
+    the others. Returns a dict of platform -> {"success", "post", "queued", "duration_ms",
+    "error"}, where "post" is the published (or queued) {"text", "image"}.
+    """
+    tenant = tenant or default_tenant
+    platforms = [p for p in (platforms or tenant.platforms) if p]
+    unknown = [p for p in platforms if p not in platform_renderers]
+    if unknown:
+        raise ValueError(f"Unknown platforms: {unknown}")
+
+    contents = {}
+    if (mode or generation_mode) == 'combined' and platforms:
+        contents = psf.get_all_platform_posts(news_items, platforms)
+    else:
+        # Concurrent requests would each miss Bedrock's prompt cache and pay to write the shared
+        # prefix, so one platform's request goes first and the others read the prefix it cached
+        warming_platform = psf.cache_warming_platform(platforms)
+        if warming_platform is not None:
+            with span("prompt_cache_warmup", platform=warming_platform):
+                contents[warming_platform] = psf.platform_post_generators[warming_platform](news_items)
+
+    max_workers = max(1, min(max_workers or platform_max_workers, len(platforms) or 1))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="platform") as executor:
+        futures = {
+            platform: executor.submit(tracer.wrap(_run_platform), platform, news_items, contents.get(platform), tenant,
+                                      queue)
+            for platform in platforms
+        }
 
-    x(news_items) # This works
-    facebook(news_items)
-    instagram(news_items)
-    # linkedin(news_items)
-    # record_to_dynamodb(news_items)
+    results = {platform: future.result() for platform, future in futures.items()}
 
     logger.info("Finished posting to social media")
+    return results
+
+
+def render_x(news_items, x_content=None):
+    if x_content is None:
+        x_content = psf.get_x_post(news_items)
+    thread = parse_platform_post("x", x_content, image_urls=[])
+    return {"text": random.choice(thread.tweets), "image": None}
+
+
+def publish_x(post, tenant: Tenant = default_tenant):
+    from x_functions import get_twitter_credentials, post_tweet
+
+    credentials = get_twitter_credentials(tenant.secret_name("x"))
+    post_tweet(tweet_text=post["text"], credentials=credentials)
+
+
+def render_facebook(news_items, facebook_content=None):
+    # Every platform is prompted with the same items, so their requests share a cacheable prefix;
+    # only items with an image can supply the post's image
+    if facebook_content is None:
+        facebook_content = psf.get_facebook_post(news_items)
+    image_urls = [item.image_url for item in news_items if item.image_url]
+    facebook_post = parse_platform_post("facebook", facebook_content, image_urls)
+    return {"text": facebook_post.text, "image": facebook_post.image}
+
 
+def publish_facebook(post, tenant: Tenant = default_tenant):
+    from facebook_functions import post_to_facebook, setup_facebook
 
-def x(news_items):
-    x_content = psf.get_x_post(news_items)
-    tweets = json.loads(x_content)
+    page = setup_facebook(tenant.secret_name("facebook"), tenant.facebook_page_name)
+    post_to_facebook(post["text"], post["image"], page["page_access_token"])
 
-    setup_twitter_vars()
-    tweet = random.choice(tweets)
-    post_tweet(tweet_text=tweet['tweet'])
 
+def render_linkedin(news_items, linkedin_content=None):
+    # Every platform is prompted with the same items, so their requests share a cacheable prefix;
+    # only items with an image can supply the post's image
+    if linkedin_content is None:
+        linkedin_content = psf.get_linkedin_post(news_items)
+    image_urls = [item.image_url for item in news_items if item.image_url]
+    linkedin_post = parse_platform_post("linkedin", linkedin_content, image_urls)
+    return {"text": linkedin_post.text, "image": linkedin_post.image}
 
-def facebook(news_items):
-    setup_facebook()
 
-    # Filter out news_items that have a blank image_url
-    news_items = [item for item in news_items if item['image_url']]
+def publish_linkedin(post, tenant: Tenant = default_tenant):
+    from linkedin_functions import post_to_linkedin
 
-    facebook_content = psf.get_facebook_post(news_items)
-    facebook_json = json.loads(facebook_content)
+    if post_to_linkedin(post["text"], post["image"], secret_name=tenant.secret_name("linkedin"),
+                        organisation_urn=tenant.linkedin_organisation_urn) is None:
+        raise RuntimeError("LinkedIn post was not published")
 
-    post_to_facebook(facebook_json['Text'], facebook_json['Image'])
 
+def render_instagram(news_items, instagram_content=None):
+    # Every platform is prompted with the same items, so their requests share a cacheable prefix;
+    # only items with an image can supply the post's image
+    if instagram_content is None:
+        instagram_content = psf.get_instagram_post(news_items)
+    image_urls = [item.image_url for item in news_items if item.image_url]
+    instagram_post = parse_platform_post("instagram", instagram_content, image_urls)
+    return {"text": instagram_post.text, "image": instagram_post.image}
 
-def linkedin(news_items):
 
-#    linkedin_content = psf.get_linkedin_post(news_items)
-#    linkedin_json = json.loads(linkedin_content)
+def publish_instagram(post, tenant: Tenant = default_tenant):
+    from facebook_functions import post_to_instagram, setup_facebook
 
-    linkedin_json =   {
-        "Text": "Unveiling the Latest Automotive Innovations and Trends\n\nThe automotive industry is abuzz with exciting new developments, from cutting-edge electric vehicles to groundbreaking safety technologies. In this post, we delve into some of the most notable recent advancements and insights.\n\nLeading the charge in sustainable mobility, Volvo has opened order books for its highly anticipated ES90 EV, boasting an impressive range of up to 435 miles thanks to next-generation electric vehicle technology. Meanwhile, BMW's latest offering, the 392bhp X3 M50 SUV, showcases a perfect blend of refinement and performance, setting a new benchmark in its segment.\n\nKEY INSIGHTS:\n\n- Used car values saw a modest 0.4% increase in February, reflecting resilient demand\n- EV adoption continues to surge, accounting for a quarter of new car registrations in the UK\n- Fleets are exploring alternative decarbonization solutions like HVO fuel as EV uptake plateaus\n\nAs the industry navigates the transition to electrification, what strategies do you see as most effective for fleets and consumers alike? We welcome your insights and experiences in this dynamic landscape.\n\n#AutomotiveInnovations #EVTrends",
-        "Image": "https://media.autoexpress.co.uk/image/private/s--hZqJKyYZ--/t_rss_image_w_845/v1741186013/autoexpress/2025/03/BMW%20X3%20M50%202025%20UK.jpg",
+    page = setup_facebook(tenant.secret_name("instagram"), tenant.facebook_page_name)
+    post_to_instagram(post["text"], post["image"], page["page_access_token"], page["instagram_page_id"])
+
+
+# Each platform's post is rendered (generated and parsed) from the news items, then published
+# as a tenant; the two halves run in the same invocation, or either side of the post queue.
+platform_renderers = {
+    "x": render_x,
+    "facebook": render_facebook,
+    "instagram": render_instagram,
+    "linkedin": render_linkedin,
+}
+
+platform_publishers = {
+    "x": publish_x,
+    "facebook": publish_facebook,
+    "instagram": publish_instagram,
+    "linkedin": publish_linkedin,
+}
+
+
+def record_to_dynamodb(news_items, platform_results, tenant: Tenant = None):
+    """Record each successfully published post in the post history table. Queued posts are recorded by the worker."""
+    tenant = tenant or default_tenant
+    metadata = {
+        "tenant": tenant.name,
+        "feeds": tenant.feed_urls,
+        "stories": [item.link for item in news_items if item.link]
     }
 
-    post_to_linkedin(linkedin_json['Text'],  linkedin_json['Image'])
+    # Conditional, so re-running a post never replaces the record (and PostedAt) of the first time
+    with PostHistoryWriter(table_name=table_name, conditional=True) as writer:
+        for platform, result in platform_results.items():
+            if not result["success"] or not result.get("post") or result.get("queued"):
+                continue
+
+            post = result["post"]
+            writer.add(
+                post_id=generate_post_id(f"{platform}\n{post['text']}"),
+                platform=platform,
+                summary=post['text'],
+                metadata=dict(metadata, image=post['image'] or "")
+            )
+
+
+def configure_logging():
+    """
+    Log at LOG_LEVEL in LOG_FORMAT, adding a handler only if none is installed (Lambda installs
+    its own). Called from the handlers rather than at import time, so importing this module has
+    no side effects.
+    """
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(message)s',
+            datefmt='%H:%M:%S'  # Hours:Minutes:Seconds format (no milliseconds)
+        ))
+        root.addHandler(handler)
+    if log_format == 'json':
+        for handler in root.handlers:
+            handler.setFormatter(JsonFormatter())
+    root.setLevel(log_level)
+
+
+def run_summary() -> dict:
+    """The traced run's per-stage timings, plus the process-wide Bedrock rate controller counters."""
+    summary = tracer.finish_run()
+    summary["bedrock_rate_controller"] = psf.bedrock_rate_controller.metrics()
+    return summary
+
+
+def run_tenant(tenant: Tenant, feeds, preload: bool = True):
+    """
+    Run the pipeline for one tenant over already-fetched feeds: take the stories newer than the
+    tenant's high-water marks, filter out seen stories, pick the stories for the prompt, then
+    generate, publish and record. feeds is a list of (feed url, parsed feed). Returns the
+    per-platform results, or None if there was nothing to post.
+    """
+    with span("tenant", tenant=tenant.name):
+        return _run_tenant(tenant, feeds, preload)
+
+
+def _run_tenant(tenant: Tenant, feeds, preload: bool):
+    high_water_store = make_store(feed_high_water_backend, feed_high_water_table_name)
+    high_water = FeedHighWaterMarks(high_water_store, tenant.story_namespace) if high_water_store else None
+    marks = {feedURL: high_water.get(feedURL) for feedURL, _ in feeds} if high_water else {}
+    parsed_feeds = [(feedURL, get_parsed_feed_items(feed, marks.get(feedURL))) for feedURL, feed in feeds]
+    new_items = dict(parsed_feeds)
+
+    # Drop stories posted on earlier runs, looking up every feed's candidates in one batch
+    seen_index = get_seen_story_index(tenant.story_namespace) if seen_stories_backend == 'dynamodb' else None
+    if seen_index is not None:
+        try:
+            seen = seen_index.seen_keys([item for _, items in parsed_feeds for item in items])
+            parsed_feeds = [
+                (feedURL, [item for item in items if story_key(item) not in seen]) for feedURL, items in parsed_feeds
+            ]
+        except Exception as e:
+            logger.warning(f"Seen-story lookup failed, not filtering: {e}")
+
+    # Rank every feed's stories together and keep the best ones that fit the prompt budget
+    aggregated_news_items = select_news_items(
+        [item for _, items in parsed_feeds for item in items],
+        max_items=max_news_items,
+        token_budget=news_token_budget
+    )
+
+    if not aggregated_news_items:
+        logger.warning(f"No news items found for {tenant.name}.")
+        return None
+
+    logger.info(f"Finished processing all feeds for {tenant.name}")
+
+    # With a post queue this run only renders; the worker publishes and needs the credentials
+    queue = make_post_queue()
+
+    if preload and queue is None:
+        try:
+            preload_secrets(tenant.platform_secret_names())
+        except Exception as e:
+            # Not fatal: each platform falls back to fetching its own secret
+            logger.warning(f"Failed to preload secrets: {e}")
+
+    platform_results = post_to_social_media(aggregated_news_items, tenant=tenant, queue=queue)
+
+    if post_history_backend == 'dynamodb':
+        try:
+            record_to_dynamodb(aggregated_news_items, platform_results, tenant)
+        except Exception as e:
+            logger.warning(f"Failed to record post history: {e}")
+
+    # Only remember the stories once they have actually gone out somewhere (or into the post queue)
+    if seen_index is not None and any(result["success"] for result in platform_results.values()):
+        try:
+            seen_index.mark_seen(aggregated_news_items)
+        except Exception as e:
+            logger.warning(f"Failed to record seen stories: {e}")
 
-def instagram(news_items):
-    setup_facebook()
+    # Likewise only move the high-water marks past this run's entries once something was posted
+    if high_water is not None and any(result["success"] for result in platform_results.values()):
+        for feedURL, items in new_items.items():
+            try:
+                high_water.advance(feedURL, items, marks.get(feedURL))
+            except Exception as e:
+                logger.warning(f"Failed to advance the high-water mark for {feedURL}: {e}")
 
-    # Filter out news_items that have a blank image_url
-    news_items = [item for item in news_items if item['image_url']]
+    return platform_results
 
-    instagram_content = psf.get_instagram_post(news_items)
-    instagram_json = json.loads(instagram_content)
 
-    post_to_instagram(instagram_json['Text'], instagram_json['Image'])
-    return
+def fetch_parsed_feeds(urls) -> dict:
+    """Fetch the feeds concurrently through the feed cache. Returns feed url -> parsed feed, in urls order."""
+    feed_store = make_store(feed_cache_backend, feed_cache_table_name)
+    return dict(fetch_feeds(urls, store=feed_store))
 
 
-def record_to_dynamodb(news_items):
-    # add to dynamo table
-    # if summary is not None:
-    #  feeds = [{"url": url, "name": f"Feed {i + 1}"} for i, url in enumerate(feed_urls)]
-    #  summary_str = str(summary)
-    #  insert_item_into_table(post_date=datetime.datetime.now(datetime.UTC).isoformat(),
-    #  post_id=generate_post_id(summary_str), summary=summary_str, metadata=feeds)
-    return
+def _run_tenant_safely(tenant: Tenant, feeds) -> dict:
+    started = time.perf_counter()
+    try:
+        platforms = run_tenant(tenant, feeds, preload=False)
+        result = {"success": platforms is not None and any(r["success"] for r in platforms.values()),
+                  "platforms": platforms or {}}
+    except Exception as e:
+        logger.exception(f"Tenant {tenant.name} failed")
+        result = {"success": False, "platforms": {}, "error": f"{type(e).__name__}: {e}"}
+
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000)
+    logger.info(f"Finished tenant {tenant.name} in {result['duration_ms']}ms (success={result['success']})")
+    return result
+
+
+def run_tenants(tenants, max_workers: int = None) -> dict:
+    """
+    Run the pipeline for several tenants concurrently.
+
+    Every distinct feed URL is fetched and parsed once and shared between the tenants that list
+    it (each tenant takes the entries past its own high-water marks from it), and
+    every tenant's secrets are preloaded in one batch. Boto3 clients, HTTP sessions, the image
+    cache and the model response cache are process-wide, so tenants share those too. Returns
+    tenant name -> {"success", "platforms", "duration_ms", "error"}; one tenant failing does not
+    affect the others.
+    """
+    clear_image_cache()
+
+    feed_urls_to_fetch = list(dict.fromkeys(url for tenant in tenants for url in tenant.feed_urls))
+    with span("fetch_feeds", feeds=len(feed_urls_to_fetch)):
+        parsed_feeds = fetch_parsed_feeds(feed_urls_to_fetch)
+
+    if not post_queue_backend:
+        try:
+            preload_secrets([name for tenant in tenants for name in tenant.platform_secret_names()])
+        except Exception as e:
+            logger.warning(f"Failed to preload secrets: {e}")
+
+    max_workers = max(1, min(max_workers or tenant_max_workers, len(tenants) or 1))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tenant") as executor:
+        futures = {
+            tenant.name: executor.submit(
+                tracer.wrap(_run_tenant_safely), tenant,
+                [(url, parsed_feeds[url]) for url in tenant.feed_urls if url in parsed_feeds]
+            )
+            for tenant in tenants
+        }
+
+    return {name: future.result() for name, future in futures.items()}
 
 
 def lambda_handler(event, context):
+    configure_logging()
+    tracer.start_run(handler="lambda_handler")
 
     query_params = event.get("queryStringParameters", {}) or {}
     code = query_params.get("code")
     logger.info(f"Received message : {event}")
 
-    # Aggregate news items from all feeds
-    aggregated_news_items = []
-    for feedURL in feed_urls:
-        feed = feedparser.parse(feedURL)
+    # Images are cached for one run only, so drop anything left in /tmp by a previous warm invocation
+    clear_image_cache()
 
-        if feed.bozo:
-            logger.warning(f"Failed to parse feed: {feedURL}")
-            continue
+    # Fetch all feeds concurrently; results come back in feed_urls order
+    with span("fetch_feeds", feeds=len(default_tenant.feed_urls)):
+        feeds = list(fetch_parsed_feeds(default_tenant.feed_urls).items())
 
-        # Get the parsed feed items (assuming get_parsed_feed_items is defined elsewhere)
-        parsed_feed_items = get_parsed_feed_items(feed)
+    platform_results = run_tenant(default_tenant, feeds)
+    if platform_results is None:
+        logger.warning("No news items found. Exiting.")
+        run_summary()
+        return
 
-        # Limit the number of stories from each feed to 5, selected randomly
-        num_items_to_select = min(5, len(parsed_feed_items))
-        random_items = random.sample(parsed_feed_items, num_items_to_select)
+    logger.info("End of script")
 
-        aggregated_news_items.extend(random_items)
-        logger.info(f"Finished processing feed: {feedURL}")
+    return {
+        "statusCode": 200,  # HTTP status code
+        "body": json.dumps({
+            "platforms": platform_results,  # Per-platform outcome and timings
+            "run": run_summary()  # Per-stage latency, bytes, tokens and retries
+        }),
+        "headers": {
+            "Content-Type": "application/json"
+        }
+    }
 
-    if not aggregated_news_items:
-        logger.warning("No news items found. Exiting.")
-        return
 
-    logger.info("Finished processing all feeds")
+def batch_handler(event, context):
+    """Run every tenant, from event["tenants"] if given, otherwise from the tenant config file."""
+    configure_logging()
+    tracer.start_run(handler="batch_handler")
+    logger.info(f"Received batch message : {event}")
+    tenants = parse_tenants(event["tenants"]) if (event or {}).get("tenants") else load_tenants()
 
-    post_to_social_media(aggregated_news_items)
+    tenant_results = run_tenants(tenants)
 
-    logger.info("End of script")
+    logger.info("End of batch")
 
     return {
-        "statusCode": 200,  # HTTP status code
-        "body": "Success",  # The response body
+        "statusCode": 200,
+        "body": json.dumps({
+            "tenants": tenant_results,  # Per-tenant, per-platform outcome and timings
+            "run": run_summary()
+        }),
         "headers": {
-            "Content-Type": "text/plain"
+            "Content-Type": "application/json"
         }
     }
 
 
+def _queued_post_tenant(body: dict) -> Tenant:
+    """The tenant a queued post is published as, from the config it was enqueued with, or None if that's invalid."""
+    try:
+        return Tenant(**body["tenant_config"])
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Queued post {body.get('post_id')} has no valid tenant config: {e}")
+        return None
+
+
+def _publish_queued_post(queue, message: QueueMessage, max_attempts: int) -> str:
+    """
+    Publish one queued post and settle its message: delete it once published, delay it to retry
+    with exponential backoff, or dead-letter it after max_attempts receives. Returns 'published',
+    'retried', 'dead_lettered', or 'failed' if the queue itself failed or kept a message it
+    couldn't dead-letter (the message then reappears once its visibility timeout runs out, and
+    an SQS trigger reports it as a batch item failure rather than letting Lambda delete it).
+    """
+    body = message.body
+    platform = body.get("platform")
+    tenant = _queued_post_tenant(body)
+
+    try:
+        if tenant is None or platform not in platform_publishers:
+            reason = f"Invalid tenant or unknown platform: {body.get('tenant')}/{platform}"
+            return "dead_lettered" if queue.dead_letter(message, reason) else "failed"
+
+        try:
+            with span("publish", platform=platform, tenant=tenant.name, attempt=message.receive_count):
+                platform_publishers[platform]({"text": body["text"], "image": body.get("image")}, tenant)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if message.receive_count >= max_attempts:
+                logger.error(f"Publishing {platform} post {body.get('post_id')} failed {message.receive_count} "
+                             f"times, dead-lettering it: {error}")
+                return "dead_lettered" if queue.dead_letter(message, error) else "failed"
+
+            delay = post_queue_retry_delay * 2 ** (message.receive_count - 1)
+            logger.warning(f"Publishing {platform} post {body.get('post_id')} failed, retrying in {delay}s: {error}")
+            queue.retry_later(message, delay)
+            return "retried"
+
+        queue.delete(message)
+        return "published"
+    except Exception:
+        logger.exception(f"Queue operation failed for message {message.id}")
+        return "failed"
+
+
+def publish_queued_posts(queue, messages, max_attempts: int = None) -> dict:
+    """
+    Publish a batch of queued posts concurrently (up to PLATFORM_MAX_WORKERS at a time) and record
+    the published ones in the post history. Returns message id -> outcome (see _publish_queued_post).
+    """
+    max_attempts = max_attempts or post_queue_max_attempts
+
+    max_workers = max(1, min(platform_max_workers, len(messages) or 1))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="publish") as executor:
+        futures = {
+            message.id: executor.submit(tracer.wrap(_publish_queued_post), queue, message, max_attempts)
+            for message in messages
+        }
+    outcomes = {message_id: future.result() for message_id, future in futures.items()}
+
+    if post_history_backend == 'dynamodb':
+        try:
+            # Conditional, so a redelivered message never replaces the first record of its post
+            with PostHistoryWriter(table_name=table_name, conditional=True) as writer:
+                for message in messages:
+                    if outcomes[message.id] != "published":
+                        continue
+                    body = message.body
+                    writer.add(
+                        post_id=body["post_id"],
+                        platform=body["platform"],
+                        summary=body["text"],
+                        metadata={"tenant": body["tenant"], "feeds": body.get("feeds", []),
+                                  "stories": body.get("stories", []), "image": body.get("image") or ""},
+                        # Keyed on the render date, so a message redelivered after midnight hits the same record
+                        post_date=body["rendered_at"][:10] if body.get("rendered_at") else None
+                    )
+        except Exception as e:
+            logger.warning(f"Failed to record post history: {e}")
+
+    return outcomes
+
+
+def drain_post_queue(queue, time_budget: float = None) -> dict:
+    """
+    Receive and publish batches of queued posts until none are visible or time_budget seconds
+    have passed. Posts delayed for a retry are left for a later drain. Returns outcome -> count.
+    """
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    counts = {"published": 0, "retried": 0, "dead_lettered": 0, "failed": 0}
+
+    while deadline is None or time.monotonic() < deadline:
+        messages = queue.receive(post_queue_batch_size, post_queue_visibility_timeout)
+        if not messages:
+            break
+        with span("publish_batch", messages=len(messages)):
+            for outcome in publish_queued_posts(queue, messages).values():
+                counts[outcome] += 1
+
+    logger.info(f"Drained post queue: {counts}")
+    return counts
+
+
+def worker_handler(event, context):
+    """
+    Publish queued posts.
+
+    Triggered by an SQS event source mapping (with ReportBatchItemFailures on), it publishes the
+    delivered records and reports the ones to retry as batch item failures. Invoked any other
+    way (on a schedule, or locally) it drains the queue itself until it is empty or the
+    invocation is close to timing out.
+    """
+    configure_logging()
+    tracer.start_run(handler="worker_handler")
+
+    queue = make_post_queue()
+    if queue is None:
+        raise ValueError("POST_QUEUE_BACKEND is not set")
+
+    # As in lambda_handler, drop images downloaded for posts published by a previous warm invocation
+    clear_image_cache()
+
+    records = (event or {}).get("Records")
+    if records:
+        messages = [
+            QueueMessage(
+                id=record["messageId"],
+                body=json.loads(record["body"]),
+                receipt=record["receiptHandle"],
+                receive_count=int(record.get("attributes", {}).get("ApproximateReceiveCount", 1))
+            )
+            for record in records
+        ]
+        outcomes = publish_queued_posts(queue, messages)
+        run_summary()
+        return {"batchItemFailures": [
+            {"itemIdentifier": message_id} for message_id, outcome in outcomes.items()
+            if outcome in ("retried", "failed")
+        ]}
+
+    time_budget = None
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        time_budget = context.get_remaining_time_in_millis() / 1000 - post_queue_worker_reserve
+
+    counts = drain_post_queue(queue, time_budget)
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "posts": counts,  # Published, retried, dead-lettered and failed posts
+            "run": run_summary()
+        }),
+        "headers": {
+            "Content-Type": "application/json"
+        }
+    }
@@ -1,57 +1,191 @@
 import json
-import boto3
+import logging
+import os
+import time
+from aws_functions import get_client
+from bedrock_functions import IncrementalJSONValidator, SchemaViolation, bedrock_rate_controller, stream_claude
+from model_routing_functions import get_route, is_fallback_error, route_stats, supports_prompt_caching
+from response_cache_functions import make_cache_key, response_cache
+from text_functions import compact_text, estimate_tokens, item_token_budget
+from tracing_functions import set_span_attributes, traced
+
+logger = logging.getLogger()
+
+# Stream responses and validate the JSON as it arrives, abandoning and retrying bad generations early
+bedrock_streaming = os.environ.get("BEDROCK_STREAMING", "") == "true"
 
 def _format_news_items(news_items):
     """Helper function to format news items consistently"""
+    # Strip HTML/boilerplate, drop sentences repeated across items and cap each item's length
+    seen_sentences = set()
+    compacted = [compact_text(item.text, item_token_budget, seen_sentences) for item in news_items]
+
+    raw_text = "".join(item.text for item in news_items)
+    compacted_text = "".join(compacted)
+    logger.info(
+        f"Compacted {len(news_items)} news items from ~{estimate_tokens(raw_text)} tokens "
+        f"({len(raw_text.encode('utf-8'))} bytes) to ~{estimate_tokens(compacted_text)} tokens "
+        f"({len(compacted_text.encode('utf-8'))} bytes)"
+    )
+
     return "\n\n".join(
-        f"Item {i + 1}:\nText: {item['text']}\nImage: {item['image_url']}"
-        for i, item in enumerate(news_items)
+        f"Item {i + 1}:\nText: {text}\nImage: {item.image_url}"
+        for i, (item, text) in enumerate(zip(news_items, compacted))
+    )
+
+def _expected_output_validator(expected: str) -> IncrementalJSONValidator:
+    """Validator for a platform's output, or for the combined multi-platform object."""
+    if expected == "combined":
+        return IncrementalJSONValidator(dict, lambda value: isinstance(value, dict))
+    return IncrementalJSONValidator(
+        list if expected == "x" else dict,
+        lambda value: is_valid_platform_post(expected, value)
+    )
+
+
+def _stream_claude_summary(client, model_id: str, payload: dict, expected: str):
+    """Streamed generation with early JSON validation, retried once if the output goes off-schema."""
+    usage = {"input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+    for attempt in range(2):
+        validator = _expected_output_validator(expected)
+        try:
+            _, metrics = stream_claude(client, model_id, payload, validator)
+            for key in usage:
+                usage[key] += metrics.get(key) or 0
+            return "".join(validator.buffer), usage
+        except SchemaViolation as e:
+            logger.warning(f"Streamed {expected} output rejected (attempt {attempt + 1}): {e}")
+    return None, usage
+
+
+def _invoke_claude(client, model_id: str, payload: dict, expected: str = None):
+    """One model call. Returns (summary text, usage)."""
+    if bedrock_streaming and expected is not None:
+        return _stream_claude_summary(client, model_id, payload, expected)
+
+    response = client.invoke_model(
+        modelId=model_id,
+        contentType="application/json",
+        accept="application/json",
+        body=json.dumps(payload)
     )
 
-def get_claude_summary(content: str):
-    # Initialize Bedrock runtime client
-    session = boto3.Session(profile_name="tradesales")
-    client = session.client("bedrock-runtime", region_name="eu-west-2")
+    # Parse the response
+    result = json.loads(response["body"].read().decode("utf-8"))
 
-    payload = {
+    # Extract the summary text from the response content
+    if "content" in result and isinstance(result["content"], list):
+        summary = "".join(
+            item.get("text", "") for item in result["content"] if item["type"] == "text"
+        ).strip()
+        return summary, result.get("usage", {})
+    else:
+        return "No summary text found in the response.", result.get("usage", {})
+
+
+def _build_payload(route: dict, content: str, context: str = None, model_id: str = None) -> dict:
+    """
+    Request body for a route. The shared context (the news items) goes first as its own
+    content block, followed by the task instructions, so every platform's request starts with
+    the same prefix. If the model supports prompt caching, the context block is marked as a
+    cache point and later requests with the same prefix read it from Bedrock's cache.
+    """
+    if context is None:
+        message_content = content  # Ensure this is a single string
+    else:
+        context_block = {"type": "text", "text": f"News items:\n{context}"}
+        if supports_prompt_caching(model_id or route["model_id"]):
+            context_block["cache_control"] = {"type": "ephemeral"}
+        message_content = [context_block, {"type": "text", "text": content}]
+
+    return {
         "anthropic_version": "bedrock-2023-05-31",  # Required field
-        "max_tokens": 1000,
+        "max_tokens": route["max_tokens"],
+        "temperature": route["temperature"],
         "messages": [
             {
                 "role": "user",
-                "content": content  # Ensure this is a single string
+                "content": message_content
             }
         ]
     }
 
-    # Send the request
-    try:
-        response = client.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps(payload)
-        )
-
-        # Parse the response
-        result = json.loads(response["body"].read().decode("utf-8"))
 
-        # Extract the summary text from the response content
-        if "content" in result and isinstance(result["content"], list):
-            summary = "".join(
-                item.get("text", "") for item in result["content"] if item["type"] == "text"
+@traced()
+def get_claude_summary(content: str, use_cache: bool = True, expected: str = None, task: str = None,
+                       context: str = None):
+    """
+    Send the prompt to Claude and return the response text.
+
+    content holds the task instructions and context optionally holds the shared news items,
+    which are sent ahead of the instructions as a cacheable prefix (see _build_payload).
+    The model, max_tokens and temperature come from the task's route in model_routes.json
+    (task defaults to expected). Calls are paced by the shared Bedrock rate controller, which
+    retries throttling and 5xx errors with backoff, and fall back to the route's fallback
+    model if the primary still fails. expected names the platform whose JSON structure the
+    response must have (or 'combined'); with streaming enabled, it is used to validate the
+    response as it is generated.
+    """
+    route = get_route(task or expected)
+    payload = _build_payload(route, content, context)
+
+    prompt_text = content if context is None else context + content
+    prompt_bytes = len(prompt_text.encode('utf-8'))
+    logger.info(f"Prompt is ~{estimate_tokens(prompt_text)} tokens ({prompt_bytes} bytes)")
+    set_span_attributes(route=route["name"], bytes=prompt_bytes, retries=0)
+
+    # Identical requests (same model and payload) are answered from the response cache
+    cache_key = make_cache_key(route["model_id"], payload)
+    if use_cache:
+        cached_summary = response_cache.get(cache_key)
+        if cached_summary is not None:
+            set_span_attributes(response_cache_hit=True)
+            return cached_summary
+
+    # Shared Bedrock runtime client
+    client = get_client("bedrock-runtime")
+
+    model_ids = [route["model_id"]]
+    if route.get("fallback_model_id") and route["fallback_model_id"] != route["model_id"]:
+        model_ids.append(route["fallback_model_id"])
+
+    # Requests draw on the per-minute token budget for the prompt plus the most the response can use
+    estimated_tokens = estimate_tokens(prompt_text) + route["max_tokens"]
+
+    # Send the request through the rate controller, which backs off and retries throttling and
+    # 5xx errors, then move to the fallback model if the primary still fails
+    for attempt, model_id in enumerate(model_ids):
+        started = time.perf_counter()
+        try:
+            model_payload = payload if model_id == route["model_id"] else _build_payload(route, content, context, model_id)
+            summary, usage = bedrock_rate_controller.call(
+                lambda: _invoke_claude(client, model_id, model_payload, expected),
+                estimated_tokens=estimated_tokens
             )
-            return summary.strip()
-        else:
-            return "No summary text found in the response."
+            route_stats.record(route["name"], model_id, (time.perf_counter() - started) * 1000, usage,
+                               fallback=attempt > 0)
+            set_span_attributes(
+                model_id=model_id,
+                fallback=attempt > 0,
+                input_tokens=usage.get("input_tokens") or 0,
+                output_tokens=usage.get("output_tokens") or 0,
+                cache_read_input_tokens=usage.get("cache_read_input_tokens") or 0
+            )
+            if use_cache and summary and summary != "No summary text found in the response.":
+                response_cache.put(cache_key, summary)
+            return summary
 
-    except Exception as e:
-        print(f"Error invoking model: {e}")
-        return None
+        except Exception as e:
+            route_stats.record(route["name"], model_id, (time.perf_counter() - started) * 1000,
+                               fallback=attempt > 0, failed=True)
+            if attempt + 1 < len(model_ids) and is_fallback_error(e):
+                logger.warning(f"{model_id} unavailable ({e}), falling back to {model_ids[attempt + 1]}")
+                continue
 
-def get_linkedin_post(news_items):
-    """Generate a LinkedIn-optimized post"""
-    prompt = """Create a LinkedIn post version of these automotive news items that:
+            logger.error(f"Error invoking model: {e}")
+            return None
+
+linkedin_prompt = """Create a LinkedIn post version of these automotive news items that:
     - Uses a professional and engaging tone
     - Focuses on concrete facts and industry developments
     - Includes specific data points and insights
@@ -68,13 +202,14 @@ def get_linkedin_post(news_items):
     }
     """
 
-    content = f"{prompt}\n\nNews items:\n{_format_news_items(news_items)}"
-    return get_claude_summary(content)
 
+def get_linkedin_post(news_items):
+    """Generate a LinkedIn-optimized post"""
+    return get_claude_summary(linkedin_prompt, expected="linkedin", context=_format_news_items(news_items))
 
 
-def get_x_post(news_items):
-    prompt = """Create a thread of tweets summarizing these automotive news items where:
+
+x_prompt = """Create a thread of tweets summarizing these automotive news items where:
     - Each tweet must be under 280 characters, including spaces and hashtags.
     - Focus only on concrete facts and developments.
     - Avoid meta-references (e.g., "the report states" or "according to").
@@ -89,14 +224,13 @@ def get_x_post(news_items):
     ]
     """
 
-    content = f"{prompt}\n\nNews items:\n{_format_news_items(news_items)}"
-    return get_claude_summary(content)
 
+def get_x_post(news_items):
+    return get_claude_summary(x_prompt, expected="x", context=_format_news_items(news_items))
 
 
-def get_facebook_post(news_items):
-    """Generate a Facebook-optimized post"""
-    prompt = """Create a Facebook post version of these automotive news items that:
+
+facebook_prompt = """Create a Facebook post version of these automotive news items that:
     - Uses a conversational but informative tone
     - Focuses on concrete facts and developments
     - Avoids meta-references
@@ -112,13 +246,13 @@ def get_facebook_post(news_items):
     }
     """
 
-    content = f"{prompt}\n\nNews items:\n{_format_news_items(news_items)}"
-    return get_claude_summary(content)
+
+def get_facebook_post(news_items):
+    """Generate a Facebook-optimized post"""
+    return get_claude_summary(facebook_prompt, expected="facebook", context=_format_news_items(news_items))
 
 
-def get_instagram_post(news_items):
-    """Generate an Instagram-optimized post"""
-    prompt = """Create an Instagram post version of these automotive news items that:
+instagram_prompt = """Create an Instagram post version of these automotive news items that:
     - Places ONE relevant emoji at the START of each news item line
     - Separates each news item with a line break
     - Includes a clear opening line with car emoji
@@ -147,9 +281,33 @@ def get_instagram_post(news_items):
     }
     """
 
-    content = f"{prompt}\n\nNews items:\n{_format_news_items(news_items)}"
-    return get_claude_summary(content)
 
+def get_instagram_post(news_items):
+    """Generate an Instagram-optimized post"""
+    return get_claude_summary(instagram_prompt, expected="instagram", context=_format_news_items(news_items))
+
+
+
+# Each platform's generation step, for callers that generate ahead of rendering
+platform_post_generators = {
+    "x": get_x_post,
+    "facebook": get_facebook_post,
+    "instagram": get_instagram_post,
+    "linkedin": get_linkedin_post,
+}
+
+
+def cache_warming_platform(platforms):
+    """
+    The platform to generate first, so its request writes the shared news prefix to Bedrock's
+    prompt cache before the other platforms' requests start, or None if no other platform would
+    read it back (its model doesn't support prompt caching, or no other platform uses that model).
+    """
+    model_ids = {platform: get_route(platform)["model_id"] for platform in platforms}
+    for platform, model_id in model_ids.items():
+        if supports_prompt_caching(model_id) and list(model_ids.values()).count(model_id) > 1:
+            return platform
+    return None
 
 
 def get_social_media_summaries(news_items):
@@ -201,15 +359,92 @@ def get_social_media_summaries(news_items):
     }
 
     # Format news items with their images
-    formatted_items = "\n\n".join(
-        f"Item {i + 1}:\nText: {item['text']}\nImage: {item['image_url']}"
-        for i, item in enumerate(news_items)
-    )
+    formatted_items = _format_news_items(news_items)
 
     # Generate summaries for each platform
     summaries = {}
     for platform, platform_prompt in platform_prompts.items():
-        content = f"{platform_prompt}\n{base_requirements}\n\nNews items:\n{formatted_items}"
-        summaries[platform] = get_claude_summary(content)
+        summaries[platform] = get_claude_summary(f"{platform_prompt}\n{base_requirements}", context=formatted_items)
+
+    return summaries
+
+
+# Per-platform generators and prompts, used for single-call generation and its per-platform fallback
+platform_generators = {
+    "x": get_x_post,
+    "facebook": get_facebook_post,
+    "instagram": get_instagram_post,
+    "linkedin": get_linkedin_post,
+}
+
+platform_instructions = {
+    "x": x_prompt,
+    "facebook": facebook_prompt,
+    "instagram": instagram_prompt,
+    "linkedin": linkedin_prompt,
+}
+
+# Platforms whose post carries one of the supplied news item images
+image_platforms = {"facebook", "instagram", "linkedin"}
+
+
+def is_valid_platform_post(platform: str, post) -> bool:
+    """Check a decoded post against the platform's expected structure."""
+    if platform == "x":
+        return (
+            isinstance(post, list) and len(post) > 0
+            and all(isinstance(tweet, dict) and isinstance(tweet.get("tweet"), str) for tweet in post)
+        )
+
+    return (
+        isinstance(post, dict)
+        and isinstance(post.get("Text"), str) and post["Text"].strip() != ""
+        and isinstance(post.get("Image"), str) and post["Image"].strip() != ""
+    )
+
+
+def get_all_platform_posts(news_items, platforms):
+    """
+    Generate every platform's post in a single model call.
+
+    Returns a dictionary of platform -> JSON string, in the same format the per-platform
+    get_*_post functions return. Platforms missing from the combined response or failing
+    validation are regenerated individually.
+    """
+    sections = "\n\n".join(
+        f"=== {platform} ===\n{platform_instructions[platform]}" for platform in platforms
+    )
+    prompt = f"""Create social media posts for each of the platforms below from the same automotive news items.
+    Follow each platform's instructions for tone and format.
+    For {", ".join(sorted(image_platforms & set(platforms))) or "image posts"}, the "Image" must be one of the non-empty Image URLs from the news items.
+
+    Output a single **valid JSON object** with double quotes, with exactly these keys: {", ".join(f'"{p}"' for p in platforms)}.
+    The value for each key is that platform's post in the JSON format its instructions describe (not a string), and there must be no text outside the JSON object.
+
+{sections}
+    """
+
+    combined_content = get_claude_summary(prompt, expected="combined", context=_format_news_items(news_items))
+
+    # Imported here because post_parsing_functions imports this module
+    from post_parsing_functions import extract_json
+
+    # Tolerate code fences or prose around the object, as the per-platform parser does
+    combined = extract_json(combined_content)
+    if not isinstance(combined, dict):
+        combined = {}
+
+    posts = {}
+    for platform in platforms:
+        post = combined.get(platform)
+        if is_valid_platform_post(platform, post):
+            posts[platform] = json.dumps(post)
+            continue
+
+        logger.warning(f"Combined response failed validation for {platform}, generating individually")
+        platform_items = news_items
+        if platform in image_platforms:
+            platform_items = [item for item in news_items if item.image_url]
+        posts[platform] = platform_generators[platform](platform_items)
 
-    return summaries
\ No newline at end of file
+    return posts
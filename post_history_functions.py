@@ -0,0 +1,127 @@
+import datetime
+import logging
+import os
+import threading
+
+from aws_functions import batch_write_items, from_dynamodb_item, get_client, to_dynamodb_item
+
+logger = logging.getLogger()
+
+post_history_table_name = 'social_media_posts'
+platform_date_index_name = 'PlatformDateIndex'
+post_history_flush_size = int(os.environ.get("POST_HISTORY_FLUSH_SIZE", "25"))
+
+# TransactWriteItems accepts at most 100 actions per request
+transact_write_limit = 100
+
+
+class PostHistoryWriter:
+    """
+    Buffers post records and writes them to the post history table in batches.
+
+    Records are keyed on a content-derived PostId and a UTC date (PostDate, by default the date
+    it was posted), so writing the same post again on a re-run targets the same item. In batch
+    mode (the default) records are flushed with BatchWriteItem, resending any unprocessed items.
+    In conditional mode they are flushed in transactions of up to 100 puts, each with
+    attribute_not_exists(PostId), so an existing record is never replaced.
+    """
+
+    def __init__(self, table_name: str = post_history_table_name, flush_size: int = post_history_flush_size,
+                 conditional: bool = False):
+        self.table_name = table_name
+        self.flush_size = flush_size
+        self.conditional = conditional
+        self.written = 0
+        self.skipped = 0
+        self._buffer = {}
+        self._lock = threading.Lock()
+
+    def add(self, post_id: str, platform: str, summary: str, metadata: dict = None, posted_at=None,
+            post_date: str = None):
+        posted_at = posted_at or datetime.datetime.now(datetime.timezone.utc)
+        item = {
+            'PostId': post_id,
+            'PostDate': post_date or posted_at.date().isoformat(),
+            'PostedAt': posted_at.isoformat(),
+            'Platform': platform,
+            'Summary': summary,
+            'Metadata': metadata or {}
+        }
+
+        with self._lock:
+            # Keyed like the table, so the same post added twice is only written once
+            self._buffer[(item['PostId'], item['PostDate'])] = item
+            should_flush = len(self._buffer) >= self.flush_size
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            items = list(self._buffer.values())
+            self._buffer.clear()
+
+        if not items:
+            return
+
+        if self.conditional:
+            for start in range(0, len(items), transact_write_limit):
+                self._write_conditionally(items[start:start + transact_write_limit])
+        else:
+            # The buffer is keyed like the table, so no batch repeats a key
+            batch_write_items(self.table_name, items)
+            self.written += len(items)
+
+        logger.info(f"Post history: wrote {self.written}, skipped {self.skipped} already recorded.")
+
+    def _write_conditionally(self, items):
+        from botocore.exceptions import ClientError
+
+        dynamodb = get_client('dynamodb')
+        while items:
+            try:
+                dynamodb.transact_write_items(TransactItems=[
+                    {'Put': {'TableName': self.table_name, 'Item': to_dynamodb_item(item),
+                             'ConditionExpression': 'attribute_not_exists(PostId)'}}
+                    for item in items
+                ])
+                self.written += len(items)
+                return
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+                if len(reasons) != len(items) or 'ConditionalCheckFailed' not in reasons \
+                        or any(code not in ('None', 'ConditionalCheckFailed') for code in reasons):
+                    raise
+
+                # One already-recorded post cancels the whole transaction, so drop those and resend the rest
+                self.skipped += reasons.count('ConditionalCheckFailed')
+                items = [item for item, code in zip(items, reasons) if code == 'None']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def get_posts_for_date(platform: str, post_date: str = None, table_name: str = post_history_table_name) -> list:
+    """Return the posts recorded for a platform on a date (default today, UTC), via the platform/date index."""
+    post_date = post_date or datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    dynamodb = get_client('dynamodb')
+
+    query = {
+        'TableName': table_name,
+        'IndexName': platform_date_index_name,
+        'KeyConditionExpression': '#platform = :platform AND #post_date = :post_date',
+        'ExpressionAttributeNames': {'#platform': 'Platform', '#post_date': 'PostDate'},
+        'ExpressionAttributeValues': to_dynamodb_item({':platform': platform, ':post_date': post_date})
+    }
+    items = []
+    while True:
+        response = dynamodb.query(**query)
+        items.extend(from_dynamodb_item(item) for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        query['ExclusiveStartKey'] = response['LastEvaluatedKey']
@@ -0,0 +1,158 @@
+import html
+import json
+import logging
+from dataclasses import dataclass
+
+import platform_summary_functions as psf
+
+logger = logging.getLogger()
+
+max_tweet_length = 280
+
+
+class PostValidationError(Exception):
+    pass
+
+
+@dataclass
+class TweetThread:
+    tweets: list
+
+
+@dataclass
+class PlatformPost:
+    text: str
+    image: str
+
+
+def extract_json(content):
+    """Return the first JSON object or array in the text, ignoring surrounding prose and code fences."""
+    if not content:
+        return None
+
+    decoder = json.JSONDecoder()
+    for index, char in enumerate(content):
+        if char not in "[{":
+            continue
+        try:
+            value, _ = decoder.raw_decode(content, index)
+            return value
+        except ValueError:
+            continue
+    return None
+
+
+def _match_image(image, image_urls):
+    """The supplied image URL the model meant, allowing for whitespace and HTML escaping."""
+    if not isinstance(image, str):
+        return None
+    candidate = html.unescape(image.strip())
+    for image_url in image_urls:
+        if candidate == image_url or candidate == html.unescape(image_url):
+            return image_url
+    return None
+
+
+def validate_post(platform: str, value, image_urls) -> tuple:
+    """
+    Check a decoded model response for a platform.
+
+    Returns (post, errors), where post is a TweetThread or PlatformPost built from the valid
+    parts and errors maps each failing field ('tweet:<index>', 'Text', 'Image') to a reason.
+    """
+    errors = {}
+
+    if platform == "x":
+        if not isinstance(value, list):
+            return None, {"tweets": "expected a JSON array of tweets"}
+
+        tweets = []
+        for index, tweet in enumerate(value):
+            text = tweet.get("tweet") if isinstance(tweet, dict) else None
+            if not isinstance(text, str) or not text.strip():
+                errors[f"tweet:{index}"] = "missing tweet text"
+            elif len(text) > max_tweet_length:
+                errors[f"tweet:{index}"] = f"{len(text)} characters, over the {max_tweet_length} limit"
+            tweets.append(text)
+        return TweetThread(tweets=tweets), errors
+
+    if not isinstance(value, dict):
+        return None, {"post": "expected a JSON object"}
+
+    text = value.get("Text")
+    if not isinstance(text, str) or not text.strip():
+        errors["Text"] = "missing post text"
+
+    image = _match_image(value.get("Image"), image_urls)
+    if image is None:
+        errors["Image"] = f"{value.get('Image')!r} is not one of the supplied image URLs"
+
+    return PlatformPost(text=text, image=image), errors
+
+
+def _repair_tweets(thread: TweetThread, errors: dict):
+    """Ask the model to shorten only the over-length tweets."""
+    indexes = [int(field.split(":")[1]) for field in errors if thread.tweets[int(field.split(":")[1])]]
+    if not indexes:
+        return
+
+    content = f"""Shorten each of these tweets to under {max_tweet_length} characters, including spaces and hashtags, keeping the facts.
+    Output only a JSON array of strings, one per tweet, in the same order.
+
+    {json.dumps([thread.tweets[index] for index in indexes])}
+    """
+    shortened = extract_json(psf.get_claude_summary(content, task="repair"))
+    if isinstance(shortened, list) and len(shortened) == len(indexes):
+        for index, text in zip(indexes, shortened):
+            thread.tweets[index] = text
+
+
+def _repair_image(post: PlatformPost, image_urls):
+    """Ask the model to pick the image from the supplied URLs, falling back to the first one."""
+    content = f"""Choose the image that best fits this social media post from the URLs below.
+    Output only the chosen URL, exactly as written.
+
+    Post:
+    {post.text}
+
+    Image URLs:
+    {chr(10).join(image_urls)}
+    """
+    post.image = _match_image(psf.get_claude_summary(content, task="repair"), image_urls) or image_urls[0]
+
+
+def parse_platform_post(platform: str, content, image_urls, repair: bool = True):
+    """
+    Turn a model response into a validated TweetThread or PlatformPost.
+
+    Failing fields are fixed with small targeted model calls (shorten the long tweets, pick
+    a valid image) rather than regenerating the whole post. Invalid tweets that can't be
+    repaired are dropped. Raises PostValidationError if no usable post remains.
+    """
+    value = extract_json(content)
+    if value is None:
+        raise PostValidationError(f"No JSON found in the {platform} response: {str(content)[:200]!r}")
+
+    post, errors = validate_post(platform, value, image_urls)
+    if post is None:
+        raise PostValidationError(f"Invalid {platform} response: {errors}")
+
+    if errors and repair:
+        logger.info(f"Repairing {platform} post fields: {errors}")
+        if platform == "x":
+            _repair_tweets(post, errors)
+        elif "Image" in errors and image_urls and "Text" not in errors:
+            _repair_image(post, image_urls)
+
+        repaired = [{"tweet": tweet} for tweet in post.tweets] if platform == "x" else {"Text": post.text, "Image": post.image}
+        post, errors = validate_post(platform, repaired, image_urls)
+
+    if platform == "x":
+        post.tweets = [tweet for index, tweet in enumerate(post.tweets) if f"tweet:{index}" not in errors]
+        if not post.tweets:
+            raise PostValidationError(f"No valid tweets in the response: {errors}")
+        return post
+
+    if errors:
+        raise PostValidationError(f"Invalid {platform} post: {errors}")
+    return post
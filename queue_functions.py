@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import store_functions
+from aws_functions import get_client
+
+logger = logging.getLogger()
+
+# SQS accepts at most 10 messages per send/receive/delete batch
+sqs_batch_limit = 10
+# Long-poll wait for each SQS receive, so an empty-looking queue isn't just a sampling miss
+sqs_wait_seconds = int(os.environ.get("SQS_WAIT_SECONDS", "2"))
+
+
+@dataclass
+class QueueMessage:
+    """A received message: its body, the handle used to delete or delay it, and how often it was received."""
+    id: str
+    body: dict
+    receipt: str
+    receive_count: int = 1
+
+
+class SQSQueue:
+    """
+    An SQS (or SQS-compatible) queue. Messages that are dead-lettered are sent to
+    dead_letter_url and deleted; without one they are left on the queue (dead_letter returns
+    False), for its redrive policy to move once they run out of receives.
+    """
+
+    def __init__(self, queue_url: str, dead_letter_url: str = None):
+        if not queue_url:
+            raise ValueError("SQS queue URL is not set")
+        self.queue_url = queue_url
+        self.dead_letter_url = dead_letter_url
+
+    def send(self, bodies) -> list:
+        sqs = get_client('sqs')
+        ids = []
+        bodies = list(bodies)
+        for start in range(0, len(bodies), sqs_batch_limit):
+            entries = [
+                {"Id": str(index), "MessageBody": json.dumps(body)}
+                for index, body in enumerate(bodies[start:start + sqs_batch_limit])
+            ]
+            response = sqs.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            if response.get("Failed"):
+                raise RuntimeError(f"Failed to enqueue {len(response['Failed'])} messages: {response['Failed']}")
+            ids.extend(entry["MessageId"] for entry in response.get("Successful", []))
+        return ids
+
+    def receive(self, max_messages: int, visibility_timeout: int) -> list:
+        response = get_client('sqs').receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, sqs_batch_limit),
+            VisibilityTimeout=visibility_timeout,
+            WaitTimeSeconds=sqs_wait_seconds,
+            AttributeNames=["ApproximateReceiveCount"]
+        )
+        return [
+            QueueMessage(
+                id=message["MessageId"],
+                body=json.loads(message["Body"]),
+                receipt=message["ReceiptHandle"],
+                receive_count=int(message.get("Attributes", {}).get("ApproximateReceiveCount", 1))
+            )
+            for message in response.get("Messages", [])
+        ]
+
+    def delete(self, message: QueueMessage):
+        get_client('sqs').delete_message(QueueUrl=self.queue_url, ReceiptHandle=message.receipt)
+
+    def retry_later(self, message: QueueMessage, delay: int):
+        # SQS caps a message's visibility timeout at 12 hours
+        get_client('sqs').change_message_visibility(
+            QueueUrl=self.queue_url, ReceiptHandle=message.receipt, VisibilityTimeout=min(int(delay), 43200)
+        )
+
+    def dead_letter(self, message: QueueMessage, reason: str) -> bool:
+        """Move the message to the dead-letter queue. Returns False if it was left on the queue instead."""
+        if not self.dead_letter_url:
+            logger.error(f"Message {message.id} failed ({reason}); leaving it for the queue's redrive policy")
+            return False
+        get_client('sqs').send_message(
+            QueueUrl=self.dead_letter_url,
+            MessageBody=json.dumps(dict(message.body, dead_letter_reason=reason,
+                                        receive_count=message.receive_count))
+        )
+        self.delete(message)
+        return True
+
+
+class MemoryQueue:
+    """In-process queue with visibility timeouts, for local runs and tests. Nothing survives the process."""
+
+    def __init__(self, name: str = "posts", dead_letter_queue: "MemoryQueue" = None):
+        self.name = name
+        self.dead_letter_queue = dead_letter_queue
+        self._messages = {}  # id -> [body, visible_at, receive_count, receipt]
+        self._lock = threading.Lock()
+
+    def send(self, bodies) -> list:
+        ids = []
+        with self._lock:
+            for body in bodies:
+                message_id = uuid.uuid4().hex
+                self._messages[message_id] = [json.loads(json.dumps(body)), 0.0, 0, None]
+                ids.append(message_id)
+        return ids
+
+    def receive(self, max_messages: int, visibility_timeout: int) -> list:
+        now = time.time()
+        received = []
+        with self._lock:
+            for message_id, record in self._messages.items():
+                if len(received) >= max_messages:
+                    break
+                if record[1] > now:
+                    continue
+                record[1] = now + visibility_timeout
+                record[2] += 1
+                record[3] = uuid.uuid4().hex
+                received.append(QueueMessage(message_id, record[0], record[3], record[2]))
+        return received
+
+    def _current(self, message: QueueMessage):
+        record = self._messages.get(message.id)
+        # A stale receipt means the message timed out and was received again since
+        return record if record is not None and record[3] == message.receipt else None
+
+    def delete(self, message: QueueMessage):
+        with self._lock:
+            if self._current(message) is not None:
+                del self._messages[message.id]
+
+    def retry_later(self, message: QueueMessage, delay: int):
+        with self._lock:
+            record = self._current(message)
+            if record is not None:
+                record[1] = time.time() + delay
+
+    def dead_letter(self, message: QueueMessage, reason: str) -> bool:
+        if self.dead_letter_queue is not None:
+            self.dead_letter_queue.send([dict(message.body, dead_letter_reason=reason,
+                                              receive_count=message.receive_count)])
+        self.delete(message)
+        return True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages)
+
+
+class SQLiteQueue:
+    """
+    Queue persisted in a SQLite file, with visibility timeouts, for local runs and tests. Several
+    named queues (e.g. a queue and its dead-letter queue) can share one file, and several
+    processes can drain the same queue.
+    """
+
+    def __init__(self, path: str, name: str = "posts", dead_letter_queue: "SQLiteQueue" = None):
+        self.path = path
+        self.name = name
+        self.dead_letter_queue = dead_letter_queue
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " id TEXT PRIMARY KEY, queue TEXT NOT NULL, body TEXT NOT NULL, sent_at REAL NOT NULL,"
+                " visible_at REAL NOT NULL, receive_count INTEGER NOT NULL DEFAULT 0, receipt TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS messages_visible ON messages (queue, visible_at)")
+
+    @contextmanager
+    def _connect(self):
+        import sqlite3  # Only local runs use this backend; keep it off the handler's import path
+
+        # Autocommit; receive() opens its own write transaction so concurrent receivers don't share messages
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def send(self, bodies) -> list:
+        now = time.time()
+        rows = [(uuid.uuid4().hex, self.name, json.dumps(body), now, now) for body in bodies]
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO messages (id, queue, body, sent_at, visible_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return [row[0] for row in rows]
+
+    def receive(self, max_messages: int, visibility_timeout: int) -> list:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT id, body, receive_count FROM messages WHERE queue = ? AND visible_at <= ?"
+                " ORDER BY sent_at LIMIT ?", (self.name, now, max_messages)
+            ).fetchall()
+
+            received = []
+            for message_id, body, receive_count in rows:
+                receipt = uuid.uuid4().hex
+                connection.execute(
+                    "UPDATE messages SET visible_at = ?, receive_count = ?, receipt = ? WHERE id = ?",
+                    (now + visibility_timeout, receive_count + 1, receipt, message_id)
+                )
+                received.append(QueueMessage(message_id, json.loads(body), receipt, receive_count + 1))
+            # Closing the connection without committing (on an error above) rolls the transaction back
+            connection.execute("COMMIT")
+            return received
+
+    def delete(self, message: QueueMessage):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM messages WHERE id = ? AND receipt = ?", (message.id, message.receipt))
+
+    def retry_later(self, message: QueueMessage, delay: int):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE messages SET visible_at = ? WHERE id = ? AND receipt = ?",
+                (time.time() + delay, message.id, message.receipt)
+            )
+
+    def dead_letter(self, message: QueueMessage, reason: str) -> bool:
+        if self.dead_letter_queue is not None:
+            self.dead_letter_queue.send([dict(message.body, dead_letter_reason=reason,
+                                              receive_count=message.receive_count)])
+        self.delete(message)
+        return True
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM messages WHERE queue = ?", (self.name,)).fetchone()[0]
+
+
+_memory_queues = {}
+_memory_queues_lock = threading.Lock()
+
+
+def make_queue(backend: str, name: str, queue_url: str = None, dead_letter_url: str = None):
+    """
+    Build a queue for the given backend ('sqs', 'sqlite', 'memory' or empty for none). Local
+    backends get a '<name>-dead-letter' queue next to the queue; memory queues are shared
+    within the process, so a worker sees what generation enqueued.
+    """
+    if not backend or backend == "none":
+        return None
+    if backend == "sqs":
+        return SQSQueue(queue_url, dead_letter_url)
+    if backend == "sqlite":
+        path = os.path.join(store_functions.store_dir, "queues.sqlite3")
+        return SQLiteQueue(path, name, dead_letter_queue=SQLiteQueue(path, f"{name}-dead-letter"))
+    if backend == "memory":
+        with _memory_queues_lock:
+            if name not in _memory_queues:
+                _memory_queues[name] = MemoryQueue(name, dead_letter_queue=MemoryQueue(f"{name}-dead-letter"))
+            return _memory_queues[name]
+
+    raise ValueError(f"Unknown queue backend: {backend}")
@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import math
+import os
+import random
+import re
+import time
+
+from news_item_functions import NewsItem
+from text_functions import compact_text, estimate_tokens, item_token_budget, shingles
+
+logger = logging.getLogger()
+
+# Topics that matter to an automotive trade audience, and how much each one adds to a story's score
+keyword_weights = {
+    "used car": 2.0,
+    "dealer": 2.0,
+    "dealership": 2.0,
+    "trade": 1.5,
+    "auction": 1.5,
+    "valuation": 1.5,
+    "residual": 1.5,
+    "registrations": 1.5,
+    "smmt": 1.5,
+    "fleet": 1.5,
+    "ev": 1.5,
+    "electric": 1.5,
+    "hybrid": 1.0,
+    "finance": 1.0,
+    "sales": 1.0,
+    "price": 1.0,
+    "prices": 1.0,
+    "market": 1.0,
+    "recall": 1.0,
+    "launch": 0.5,
+}
+keyword_score_cap = 5.0
+recency_weight = 3.0
+recency_half_life_hours = float(os.environ.get("RECENCY_HALF_LIFE_HOURS", "24"))
+image_bonus = 1.0
+
+# Stories whose shingle sets have an estimated Jaccard similarity above this are treated as the same story
+near_duplicate_threshold = 0.4
+minhash_bands = 16
+minhash_rows = 2
+shingle_size = 2
+_minhash_prime = (1 << 61) - 1
+_rng = random.Random(42)  # fixed seed so signatures are comparable between runs
+_minhash_params = [
+    (_rng.randrange(1, _minhash_prime), _rng.randrange(0, _minhash_prime))
+    for _ in range(minhash_bands * minhash_rows)
+]
+
+_keyword_pattern = re.compile(
+    r"\b(" + "|".join(re.escape(keyword) for keyword in sorted(keyword_weights, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+
+
+def score_item(item: NewsItem, now: float = None) -> float:
+    """Score a story by recency, trade keywords and whether it has an image."""
+    now = now or time.time()
+    score = 0.0
+
+    if item.published:
+        age_hours = max(0.0, (now - item.published) / 3600)
+        score += recency_weight * math.pow(0.5, age_hours / recency_half_life_hours)
+
+    matched = {match.lower() for match in _keyword_pattern.findall(item.text)}
+    score += min(keyword_score_cap, sum(keyword_weights[keyword] for keyword in matched))
+
+    if item.image_url:
+        score += image_bonus
+
+    return score
+
+
+def minhash_signature(text: str) -> tuple:
+    """MinHash signature of the text's word shingles."""
+    hashed = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), "big")
+        for shingle in shingles(text, shingle_size)
+    ]
+    if not hashed:
+        return tuple([0] * len(_minhash_params))
+
+    return tuple(min((a * h + b) % _minhash_prime for h in hashed) for a, b in _minhash_params)
+
+
+class NearDuplicateIndex:
+    """Locality-sensitive hashing over MinHash signatures, so each lookup only compares likely matches."""
+
+    def __init__(self):
+        self._buckets = [{} for _ in range(minhash_bands)]
+
+    def _bands(self, signature):
+        for band in range(minhash_bands):
+            yield band, signature[band * minhash_rows:(band + 1) * minhash_rows]
+
+    def is_duplicate(self, signature) -> bool:
+        candidates = set()
+        for band, key in self._bands(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+
+        for candidate in candidates:
+            similarity = sum(a == b for a, b in zip(signature, candidate)) / len(signature)
+            if similarity >= near_duplicate_threshold:
+                return True
+        return False
+
+    def add(self, signature):
+        for band, key in self._bands(signature):
+            self._buckets[band].setdefault(key, []).append(signature)
+
+
+def select_news_items(news_items, max_items: int, token_budget: int) -> list:
+    """
+    Pick the highest scoring stories, skipping near-duplicates of stories already picked,
+    until max_items are chosen or the estimated prompt tokens of their compacted text reach
+    token_budget.
+    """
+    now = time.time()
+    ranked = sorted(news_items, key=lambda item: score_item(item, now), reverse=True)
+
+    selected = []
+    used_tokens = 0
+    duplicates = NearDuplicateIndex()
+    for item in ranked:
+        if len(selected) >= max_items:
+            break
+
+        # Budget on what the item will take in the prompt once compacted, not its raw HTML
+        item_tokens = min(estimate_tokens(compact_text(item.text, item_token_budget)), item_token_budget)
+        if used_tokens + item_tokens > token_budget:
+            continue
+
+        signature = minhash_signature(item.text)
+        if duplicates.is_duplicate(signature):
+            continue
+
+        duplicates.add(signature)
+        selected.append(item)
+        used_tokens += item_tokens
+
+    logger.info(f"Selected {len(selected)} of {len(news_items)} stories (~{used_tokens} tokens).")
+    return selected
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from store_functions import make_store
+
+logger = logging.getLogger()
+
+llm_cache_ttl = int(os.environ.get("LLM_CACHE_TTL_SECONDS", "21600"))
+llm_cache_max_entries = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "256"))
+# Optional persistent tier behind the in-memory cache: 'dynamodb', 'file' or unset to disable
+llm_cache_backend = os.environ.get("LLM_CACHE_BACKEND", "")
+llm_cache_table_name = "llm_response_cache"
+
+
+def make_cache_key(model_id: str, payload: dict) -> str:
+    """Generates a content hash for a model request."""
+    key_content = model_id + "\n" + json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(key_content.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of model responses.
+
+    The first tier is a size-bounded in-memory LRU, which survives across warm Lambda
+    invocations. The optional second tier is any store from store_functions and is
+    consulted on a memory miss.
+    """
+
+    def __init__(self, ttl: int = llm_cache_ttl, max_entries: int = llm_cache_max_entries, store=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self._log("hit", key)
+                    return value
+                del self._entries[key]
+
+        value = None
+        if self.store is not None:
+            try:
+                value = self.store.get(key)
+            except Exception as e:
+                logger.warning(f"LLM cache store read failed: {e}")
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                self._log("miss", key)
+                return None
+
+            self.hits += 1
+            self.store_hits += 1
+            self._remember(key, value, now)
+            self._log("store hit", key)
+            return value
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._remember(key, value, time.time())
+
+        if self.store is not None:
+            try:
+                self.store.put(key, value, ttl=self.ttl)
+            except Exception as e:
+                logger.warning(f"LLM cache store write failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "store_hits": self.store_hits,
+                "entries": len(self._entries)
+            }
+
+    def _remember(self, key, value, now):
+        self._entries[key] = (value, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _log(self, outcome, key):
+        logger.info(f"LLM cache {outcome} ({key[:12]}): hits={self.hits} misses={self.misses} "
+                    f"store_hits={self.store_hits}")
+
+
+response_cache = ResponseCache(store=make_store(llm_cache_backend, llm_cache_table_name))
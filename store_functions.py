@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from aws_functions import from_dynamodb_item, get_client, to_dynamodb_item
+
+logger = logging.getLogger()
+
+# Default location for file backed stores; /tmp is the only writable path in Lambda
+store_dir = os.environ.get("STORE_DIR", "/tmp/socials_cache")
+
+# One lock per store file, shared by every FileStore on that path, so concurrent writers don't lose updates
+_file_locks = {}
+_file_locks_lock = threading.Lock()
+
+
+def _file_lock(path: str) -> threading.Lock:
+    path = os.path.abspath(path)
+    with _file_locks_lock:
+        if path not in _file_locks:
+            _file_locks[path] = threading.Lock()
+        return _file_locks[path]
+
+
+class FileStore:
+    """
+    Key/value store persisted as a single JSON file. Intended for local runs and tests.
+    Safe to use from several threads, including through separate instances for the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = _file_lock(path)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring corrupt store file: {self.path}")
+            return {}
+
+    def get(self, key: str):
+        with self._lock:
+            record = self._load().get(key)
+
+        if record is None:
+            return None
+        if record.get("expires_at") and record["expires_at"] <= time.time():
+            return None
+        return record["value"]
+
+    def put(self, key: str, value, ttl: int = None):
+        with self._lock:
+            records = self._load()
+            records[key] = {
+                "value": value,
+                "expires_at": int(time.time() + ttl) if ttl else None
+            }
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Unique per writer, so another process writing the same file can't replace it mid-write
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f)
+            os.replace(tmp_path, self.path)
+
+
+class DynamoDBStore:
+    """Key/value store backed by a DynamoDB table with a 'CacheKey' partition key and an 'ExpiresAt' TTL."""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def get(self, key: str):
+        response = get_client('dynamodb').get_item(TableName=self.table_name, Key=to_dynamodb_item({"CacheKey": key}))
+        if "Item" not in response:
+            return None
+
+        item = from_dynamodb_item(response["Item"])
+        # DynamoDB TTL deletion is lazy, so expired items can still be returned for a while
+        if "ExpiresAt" in item and int(item["ExpiresAt"]) <= time.time():
+            return None
+        return json.loads(item["Value"])
+
+    def put(self, key: str, value, ttl: int = None):
+        item = {
+            "CacheKey": key,
+            "Value": json.dumps(value)
+        }
+        if ttl:
+            item["ExpiresAt"] = int(time.time() + ttl)
+
+        get_client('dynamodb').put_item(TableName=self.table_name, Item=to_dynamodb_item(item))
+
+
+def make_store(backend: str, name: str):
+    """Build a store for the given backend ('file', 'dynamodb' or empty for none)."""
+    if not backend or backend == "none":
+        return None
+    if backend == "file":
+        return FileStore(os.path.join(store_dir, f"{name}.json"))
+    if backend == "dynamodb":
+        return DynamoDBStore(name)
+
+    raise ValueError(f"Unknown store backend: {backend}")
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+
+logger = logging.getLogger()
+
+tenants_path = os.environ.get(
+    "TENANTS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tenants.json")
+)
+
+# How many tenants the batch runner processes at the same time
+tenant_max_workers = int(os.environ.get("TENANT_MAX_WORKERS", "4"))
+
+# Secrets Manager secret each platform reads its credentials from, unless a tenant overrides it
+default_secret_names = {
+    "x": "TwitterAPICredentials",
+    "facebook": "FacebookCredentials",
+    "instagram": "FacebookCredentials",
+    "linkedin": "LinkedInCredentials",
+}
+
+
+@dataclass
+class Tenant:
+    """
+    One brand the pipeline posts for: its feeds, the platforms it posts to, where its
+    credentials are kept and which Facebook page and LinkedIn organisation it posts as.
+
+    story_namespace separates the tenant's seen stories from other tenants'; it defaults to
+    the tenant name. facebook_page_name is required when facebook or instagram is enabled, and
+    linkedin_organisation_urn when linkedin is.
+    """
+    name: str
+    feed_urls: list
+    platforms: list
+    secret_names: dict = field(default_factory=dict)
+    facebook_page_name: str = None
+    linkedin_organisation_urn: str = None
+    story_namespace: str = None
+
+    def __post_init__(self):
+        self.platforms = [platform for platform in self.platforms if platform]
+        unknown = [platform for platform in self.platforms if platform not in default_secret_names]
+        if unknown:
+            raise ValueError(f"Tenant {self.name} has unknown platforms: {unknown}")
+
+        # Without these a tenant would post as another brand's page or organisation
+        if not self.facebook_page_name and {"facebook", "instagram"} & set(self.platforms):
+            raise ValueError(f"Tenant {self.name} posts to Facebook/Instagram but has no facebook_page_name")
+        if not self.linkedin_organisation_urn and "linkedin" in self.platforms:
+            raise ValueError(f"Tenant {self.name} posts to LinkedIn but has no linkedin_organisation_urn")
+
+        self.secret_names = dict(default_secret_names, **self.secret_names)
+        if self.story_namespace is None:
+            self.story_namespace = self.name
+
+    def secret_name(self, platform: str) -> str:
+        return self.secret_names[platform]
+
+    def platform_secret_names(self) -> list:
+        """The secrets this tenant's enabled platforms read, without duplicates."""
+        return list(dict.fromkeys(self.secret_names[platform] for platform in self.platforms))
+
+
+def parse_tenants(config) -> list:
+    """Build tenants from a list of dicts (or {"tenants": [...]}) with Tenant's field names."""
+    if isinstance(config, dict):
+        config = config.get("tenants", [])
+
+    tenants = [Tenant(**tenant) for tenant in config]
+    names = [tenant.name for tenant in tenants]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate tenant names: {duplicates}")
+    return tenants
+
+
+def load_tenants(path: str = None) -> list:
+    """Load the tenant config file (TENANTS_PATH, default tenants.json)."""
+    with open(path or tenants_path, "r", encoding="utf-8") as f:
+        tenants = parse_tenants(json.load(f))
+    logger.info(f"Loaded {len(tenants)} tenants from {path or tenants_path}")
+    return tenants
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The pipeline's modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep boto3 away from the local 'tradesales' profile; tests only talk to the fakes in fake_backends
+os.environ.setdefault("AWS_PROFILE_NAME", "")
@@ -0,0 +1,118 @@
+import json
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from bedrock_functions import BedrockRateController
+from fake_backends import FakeBedrockClient
+
+body = json.dumps({"messages": [{"role": "user", "content": "Write a post"}]})
+
+
+def make_controller(**kwargs):
+    # Limits high enough that the token buckets never wait, and backoff short enough to keep tests quick
+    kwargs.setdefault("max_concurrency", 4)
+    kwargs.setdefault("base_delay", 0.001)
+    kwargs.setdefault("max_delay", 0.001)
+    return BedrockRateController(requests_per_minute=100000, tokens_per_minute=10000000, **kwargs)
+
+
+def throttling_error():
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "slow down"},
+                        "ResponseMetadata": {"HTTPStatusCode": 429}}, "InvokeModel")
+
+
+def test_throttled_calls_are_retried_until_they_succeed():
+    client = FakeBedrockClient(['{"Text": "Hi"}'], throttle_rate=0.5, seed=7)
+    controller = make_controller(max_attempts=20)
+
+    for _ in range(20):
+        controller.call(lambda: client.invoke_model(modelId="model", body=body))
+
+    metrics = controller.metrics()
+    assert client.throttled > 0
+    assert len(client.requests) == 20
+    assert metrics["calls"] == metrics["successes"] == 20
+    assert metrics["failures"] == 0
+    assert metrics["retries"] == metrics["throttles"] == client.throttled
+
+
+def test_throttling_halves_the_concurrency_limit_down_to_the_minimum():
+    controller = make_controller(max_concurrency=8, min_concurrency=2)
+    errors = iter([throttling_error()] * 3)
+
+    def throttled_then_ok():
+        error = next(errors, None)
+        if error:
+            raise error
+        return "ok"
+
+    assert controller.call(throttled_then_ok) == "ok"
+    # 8 -> 4 -> 2 -> 2 (floored at min_concurrency), then one success adds 1/limit
+    assert controller.concurrency_limit == pytest.approx(2.5)
+    assert controller.in_flight == 0
+
+
+def test_successes_grow_the_concurrency_limit_back_to_the_maximum():
+    controller = make_controller(max_concurrency=4)
+    controller.concurrency_limit = 1.0
+
+    controller.call(lambda: "ok")
+    assert controller.concurrency_limit == pytest.approx(2.0)
+
+    for _ in range(50):
+        controller.call(lambda: "ok")
+    assert controller.concurrency_limit == 4.0
+
+
+def test_non_retryable_errors_are_raised_without_retrying():
+    controller = make_controller()
+    attempts = []
+
+    def fail():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        controller.call(fail)
+
+    metrics = controller.metrics()
+    assert len(attempts) == 1
+    assert metrics["retries"] == 0
+    assert metrics["failures"] == 1
+    assert controller.concurrency_limit == 4.0
+
+
+def test_last_throttling_error_is_raised_after_max_attempts():
+    client = FakeBedrockClient(throttle_rate=1.0)
+    controller = make_controller(max_attempts=3)
+
+    with pytest.raises(ClientError):
+        controller.call(lambda: client.invoke_model(modelId="model", body=body))
+
+    metrics = controller.metrics()
+    assert client.throttled == 3
+    assert metrics["retries"] == 2
+    assert metrics["throttles"] == 3
+    assert metrics["failures"] == 1
+    assert metrics["successes"] == 0
+
+
+def test_concurrency_cap_keeps_calls_under_the_service_limit():
+    client = FakeBedrockClient(['{"Text": "Hi"}'], latency=0.01, max_concurrency=3)
+    controller = make_controller(max_concurrency=3)
+
+    threads = [
+        threading.Thread(target=controller.call, args=(lambda: client.invoke_model(modelId="model", body=body),))
+        for _ in range(12)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.throttled == 0
+    assert client.peak_in_flight <= 3
+    assert len(client.requests) == 12
+    assert controller.metrics()["successes"] == 12
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from bedrock_functions import IncrementalJSONValidator, SchemaViolation, stream_claude
+from fake_backends import FakeBedrockClient
+
+
+def feed_in_chunks(validator, text, size=3):
+    for start in range(0, len(text), size):
+        validator.feed(text[start:start + size])
+
+
+def test_object_fed_in_chunks_is_decoded():
+    validator = IncrementalJSONValidator(dict)
+    feed_in_chunks(validator, '  {"Text": "Hello", "Image": "http://example.com/a.jpg"}')
+    validator.close()
+
+    assert validator.complete
+    assert validator.value == {"Text": "Hello", "Image": "http://example.com/a.jpg"}
+
+
+def test_brackets_inside_strings_are_ignored():
+    validator = IncrementalJSONValidator(list)
+    feed_in_chunks(validator, '[{"tweet": "Prices up ]} and \\"down\\" {["}]')
+
+    assert validator.value == [{"tweet": 'Prices up ]} and "down" {['}]
+
+
+def test_code_fence_is_tolerated():
+    validator = IncrementalJSONValidator(dict)
+    feed_in_chunks(validator, '```json\n{"Text": "Hi"}\n```')
+
+    assert validator.value == {"Text": "Hi"}
+
+
+def test_wrong_opening_fails_on_the_first_character():
+    validator = IncrementalJSONValidator(list)
+    with pytest.raises(SchemaViolation):
+        validator.feed("{")
+
+
+def test_prose_before_the_value_fails_immediately():
+    validator = IncrementalJSONValidator(dict)
+    with pytest.raises(SchemaViolation):
+        validator.feed("Here is")
+
+
+def test_mismatched_bracket_fails():
+    validator = IncrementalJSONValidator(dict)
+    with pytest.raises(SchemaViolation):
+        validator.feed('{"Text": ["a"}')
+
+
+def test_value_rejected_by_validate_fails():
+    validator = IncrementalJSONValidator(dict, lambda value: "Text" in value)
+    with pytest.raises(SchemaViolation):
+        validator.feed('{"Image": ""}')
+
+
+def test_close_before_the_value_completes_fails():
+    validator = IncrementalJSONValidator(dict)
+    validator.feed('{"Text": "cut o')
+    with pytest.raises(SchemaViolation):
+        validator.close()
+
+
+def test_stream_is_abandoned_as_soon_as_output_is_invalid():
+    client = FakeBedrockClient(["Sorry, " + "x" * 500], chunk_chars=8)
+    response = client.invoke_model_with_response_stream
+    streams = []
+    client.invoke_model_with_response_stream = lambda **kwargs: streams.append(response(**kwargs)) or streams[-1]
+
+    payload = {"messages": [{"role": "user", "content": "Write a post"}]}
+    with pytest.raises(SchemaViolation):
+        stream_claude(client, "model", payload, IncrementalJSONValidator(dict))
+
+    stream = streams[0]["body"]
+    assert stream.closed
+    assert stream.events_read < len(stream.events)
+
+
+def test_stream_returns_the_text_and_usage():
+    client = FakeBedrockClient([json.dumps({"Text": "Hello", "Image": ""})], chunk_chars=5)
+    payload = {"messages": [{"role": "user", "content": "Write a post"}]}
+
+    text, metrics = stream_claude(client, "model", payload, IncrementalJSONValidator(dict))
+
+    assert json.loads(text) == {"Text": "Hello", "Image": ""}
+    assert metrics["output_tokens"] > 0
+    assert metrics["time_to_first_token_ms"] is not None
@@ -0,0 +1,113 @@
+import datetime
+
+import pytest
+
+import aws_functions
+from fake_backends import FakeDynamoDBClient
+from post_history_functions import PostHistoryWriter, get_posts_for_date, platform_date_index_name
+from queue_functions import MemoryQueue
+
+table_name = "social_media_posts"
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    client = FakeDynamoDBClient({table_name: ["PostId", "PostDate"]}, billing_mode="PROVISIONED")
+    monkeypatch.setitem(aws_functions._clients, ("dynamodb", aws_functions.aws_region_name), client)
+    return client
+
+
+def stored_items(dynamodb):
+    return [aws_functions.from_dynamodb_item(item) for item in dynamodb.tables[table_name].values()]
+
+
+def test_batch_mode_writes_each_buffered_record_once(dynamodb):
+    with PostHistoryWriter(table_name, flush_size=100) as writer:
+        for index in range(60):
+            writer.add(post_id=f"post-{index}", platform="x", summary="Hello")
+        writer.add(post_id="post-0", platform="x", summary="Hello")
+
+    assert writer.written == 60
+    assert len(stored_items(dynamodb)) == 60
+
+
+def test_conditional_mode_never_replaces_a_recorded_post(dynamodb):
+    first_posted = datetime.datetime(2026, 10, 17, 9, 0, tzinfo=datetime.timezone.utc)
+    with PostHistoryWriter(table_name, conditional=True) as writer:
+        writer.add(post_id="a", platform="x", summary="Hello", posted_at=first_posted)
+
+    with PostHistoryWriter(table_name, conditional=True) as writer:
+        writer.add(post_id="a", platform="x", summary="Hello", posted_at=first_posted + datetime.timedelta(hours=1))
+        writer.add(post_id="b", platform="x", summary="World", posted_at=first_posted)
+
+    assert (writer.written, writer.skipped) == (1, 1)
+    records = {item["PostId"]: item for item in stored_items(dynamodb)}
+    assert records["a"]["PostedAt"] == first_posted.isoformat()
+    assert set(records) == {"a", "b"}
+
+
+def test_conditional_mode_writes_in_transactions_of_up_to_100(dynamodb):
+    with PostHistoryWriter(table_name, flush_size=250, conditional=True) as writer:
+        for index in range(250):
+            writer.add(post_id=f"post-{index}", platform="facebook", summary="Hello")
+
+    assert writer.written == 250
+    assert dynamodb.transactions == 3
+    assert len(stored_items(dynamodb)) == 250
+
+
+def test_redelivery_after_midnight_hits_the_same_record(dynamodb):
+    rendered = datetime.datetime(2026, 10, 17, 23, 59, tzinfo=datetime.timezone.utc)
+    with PostHistoryWriter(table_name, conditional=True) as writer:
+        writer.add(post_id="a", platform="x", summary="Hello", posted_at=rendered, post_date="2026-10-17")
+    with PostHistoryWriter(table_name, conditional=True) as writer:
+        writer.add(post_id="a", platform="x", summary="Hello", posted_at=rendered + datetime.timedelta(minutes=5),
+                   post_date="2026-10-17")
+
+    assert writer.skipped == 1
+    assert len(stored_items(dynamodb)) == 1
+
+
+def test_get_posts_for_date_returns_the_platforms_posts_on_that_date(dynamodb):
+    with PostHistoryWriter(table_name) as writer:
+        writer.add(post_id="a", platform="x", summary="One", post_date="2026-10-17")
+        writer.add(post_id="b", platform="x", summary="Two", post_date="2026-10-17")
+        writer.add(post_id="c", platform="facebook", summary="Three", post_date="2026-10-17")
+        writer.add(post_id="d", platform="x", summary="Four", post_date="2026-10-16")
+
+    posts = get_posts_for_date("x", "2026-10-17", table_name=table_name)
+
+    assert sorted(post["Summary"] for post in posts) == ["One", "Two"]
+
+
+def test_add_platform_date_index_adds_the_index_once(dynamodb):
+    import news_to_social_media as ntsm
+
+    assert ntsm.add_platform_date_index(table_name) is not None
+    assert ntsm.add_platform_date_index(table_name) is None
+
+    [index] = dynamodb.descriptions[table_name]["GlobalSecondaryIndexes"]
+    assert index["IndexName"] == platform_date_index_name
+    assert [key["AttributeName"] for key in index["KeySchema"]] == ["Platform", "PostDate"]
+    # The table is provisioned, so the index needs its own throughput
+    assert index["ProvisionedThroughput"] == {"ReadCapacityUnits": 5, "WriteCapacityUnits": 5}
+
+
+def test_queued_post_is_recorded_under_its_render_date(dynamodb, monkeypatch):
+    import news_to_social_media as ntsm
+
+    monkeypatch.setattr(ntsm, "post_history_backend", "dynamodb")
+    monkeypatch.setitem(ntsm.platform_publishers, "x", lambda post, tenant: None)
+
+    queue = MemoryQueue("posts")
+    body = ntsm.post_message(ntsm.default_tenant, "x", {"text": "Hello", "image": None}, [])
+    body["rendered_at"] = "2026-10-17T23:59:00+00:00"
+    queue.send([body, body])
+
+    # Both deliveries of the post are published, but only the first is recorded
+    outcomes = ntsm.publish_queued_posts(queue, queue.receive(10, visibility_timeout=300))
+
+    assert list(outcomes.values()) == ["published", "published"]
+    [record] = stored_items(dynamodb)
+    assert record["PostDate"] == "2026-10-17"
+    assert record["PostId"] == body["post_id"]
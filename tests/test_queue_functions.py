@@ -0,0 +1,178 @@
+import pytest
+
+import queue_functions
+from queue_functions import MemoryQueue, QueueMessage, SQLiteQueue, SQSQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(queue_functions.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def queue(request, tmp_path):
+    if request.param == "memory":
+        return MemoryQueue("posts", dead_letter_queue=MemoryQueue("posts-dead-letter"))
+    path = str(tmp_path / "queues.sqlite3")
+    return SQLiteQueue(path, "posts", dead_letter_queue=SQLiteQueue(path, "posts-dead-letter"))
+
+
+def test_received_message_is_hidden_until_its_visibility_timeout(queue, clock):
+    queue.send([{"post_id": "a"}])
+
+    [message] = queue.receive(10, visibility_timeout=30)
+    assert message.body == {"post_id": "a"}
+    assert message.receive_count == 1
+
+    clock.now += 29
+    assert queue.receive(10, visibility_timeout=30) == []
+
+    clock.now += 1
+    [again] = queue.receive(10, visibility_timeout=30)
+    assert again.id == message.id
+    assert again.receive_count == 2
+    assert again.receipt != message.receipt
+
+
+def test_receive_returns_at_most_max_messages(queue, clock):
+    queue.send([{"post_id": str(index)} for index in range(5)])
+
+    assert len(queue.receive(3, visibility_timeout=30)) == 3
+    assert len(queue.receive(3, visibility_timeout=30)) == 2
+    assert len(queue) == 5
+
+
+def test_delete_removes_the_message(queue, clock):
+    queue.send([{"post_id": "a"}])
+    [message] = queue.receive(10, visibility_timeout=30)
+
+    queue.delete(message)
+
+    assert len(queue) == 0
+    clock.now += 60
+    assert queue.receive(10, visibility_timeout=30) == []
+
+
+def test_stale_receipt_cannot_delete_or_delay_the_message(queue, clock):
+    queue.send([{"post_id": "a"}])
+    [stale] = queue.receive(10, visibility_timeout=30)
+    clock.now += 30
+    [current] = queue.receive(10, visibility_timeout=30)
+
+    # The first receiver finishes late; the message now belongs to the second one
+    queue.delete(stale)
+    queue.retry_later(stale, 3600)
+    assert len(queue) == 1
+
+    clock.now += 30
+    [third] = queue.receive(10, visibility_timeout=30)
+    assert third.receive_count == 3
+
+
+def test_retry_later_hides_the_message_for_the_delay(queue, clock):
+    queue.send([{"post_id": "a"}])
+    [message] = queue.receive(10, visibility_timeout=30)
+
+    queue.retry_later(message, 120)
+
+    clock.now += 119
+    assert queue.receive(10, visibility_timeout=30) == []
+    clock.now += 1
+    [again] = queue.receive(10, visibility_timeout=30)
+    assert again.receive_count == 2
+
+
+def test_dead_letter_moves_the_message_with_its_reason(queue, clock):
+    queue.send([{"post_id": "a"}])
+    [message] = queue.receive(10, visibility_timeout=30)
+
+    assert queue.dead_letter(message, "RuntimeError: boom") is True
+
+    assert len(queue) == 0
+    [dead] = queue.dead_letter_queue.receive(10, visibility_timeout=30)
+    assert dead.body == {"post_id": "a", "dead_letter_reason": "RuntimeError: boom", "receive_count": 1}
+
+
+def test_sqlite_queues_sharing_a_file_are_separate(tmp_path, clock):
+    path = str(tmp_path / "queues.sqlite3")
+    posts, other = SQLiteQueue(path, "posts"), SQLiteQueue(path, "other")
+    posts.send([{"post_id": "a"}])
+
+    assert other.receive(10, visibility_timeout=30) == []
+    assert len(SQLiteQueue(path, "posts")) == 1
+
+
+def test_sqs_queue_without_a_dead_letter_url_leaves_the_message():
+    queue = SQSQueue("https://sqs.example.com/123/posts")
+    message = QueueMessage("id", {"post_id": "a"}, "receipt", 5)
+
+    # Returns before touching SQS, so the queue's redrive policy can move the message
+    assert queue.dead_letter(message, "boom") is False
+
+
+def test_make_queue_shares_memory_queues_within_the_process():
+    first = queue_functions.make_queue("memory", "test-shared")
+    first.send([{"post_id": "a"}])
+
+    second = queue_functions.make_queue("memory", "test-shared")
+    assert second is first
+    assert second.dead_letter_queue.name == "test-shared-dead-letter"
+    assert queue_functions.make_queue("none", "test-shared") is None
+    with pytest.raises(ValueError):
+        queue_functions.make_queue("kafka", "test-shared")
+
+
+def test_worker_retries_a_failing_post_then_dead_letters_it(monkeypatch, clock):
+    import news_to_social_media as ntsm
+
+    attempts = []
+
+    def failing_publisher(post, tenant):
+        attempts.append(post["text"])
+        raise RuntimeError("platform is down")
+
+    monkeypatch.setitem(ntsm.platform_publishers, "x", failing_publisher)
+    monkeypatch.setattr(ntsm, "post_queue_retry_delay", 60)
+
+    queue = MemoryQueue("posts", dead_letter_queue=MemoryQueue("posts-dead-letter"))
+    post = {"text": "Hello", "image": None}
+    queue.send([ntsm.post_message(ntsm.default_tenant, "x", post, [])])
+
+    outcomes = []
+    for delay in (60, 120):
+        [message] = queue.receive(10, visibility_timeout=300)
+        outcomes.append(ntsm._publish_queued_post(queue, message, max_attempts=3))
+        clock.now += delay - 1
+        assert queue.receive(10, visibility_timeout=300) == []
+        clock.now += 1
+
+    [message] = queue.receive(10, visibility_timeout=300)
+    outcomes.append(ntsm._publish_queued_post(queue, message, max_attempts=3))
+
+    assert outcomes == ["retried", "retried", "dead_lettered"]
+    assert attempts == ["Hello"] * 3
+    assert len(queue) == 0
+    [dead] = queue.dead_letter_queue.receive(10, visibility_timeout=300)
+    assert dead.body["dead_letter_reason"] == "RuntimeError: platform is down"
+    assert dead.body["receive_count"] == 3
+
+
+def test_worker_dead_letters_a_message_without_a_valid_tenant(clock):
+    import news_to_social_media as ntsm
+
+    queue = MemoryQueue("posts", dead_letter_queue=MemoryQueue("posts-dead-letter"))
+    queue.send([{"post_id": "a", "tenant": "gone", "platform": "x", "text": "Hello"}])
+    [message] = queue.receive(10, visibility_timeout=300)
+
+    assert ntsm._publish_queued_post(queue, message, max_attempts=3) == "dead_lettered"
+    assert len(queue.dead_letter_queue) == 1
@@ -0,0 +1,116 @@
+import os
+import re
+from html.parser import HTMLParser
+
+# Rough characters-per-token ratio for English text with Claude's tokenizer
+chars_per_token = 4
+
+# Most tokens of text each news item may contribute to a prompt after compaction
+item_token_budget = int(os.environ.get("ITEM_TOKEN_BUDGET", "150"))
+
+_word_pattern = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, good enough for budgeting prompts without calling a tokenizer."""
+    return (len(text) + chars_per_token - 1) // chars_per_token
+
+
+def words(text: str) -> list:
+    """Lower-cased word tokens."""
+    return _word_pattern.findall(text.lower())
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Set of overlapping word n-grams, used for near-duplicate detection."""
+    tokens = words(text)
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML fragment, dropping scripts, styles and tags."""
+
+    skipped_tags = ("script", "style", "noscript")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skipped_tags:
+            self._skip_depth += 1
+        elif tag in ("p", "br", "div", "li"):
+            self.parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.skipped_tags and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+# RSS boilerplate appended by publishing platforms
+_boilerplate_patterns = [
+    re.compile(r"The post .+? appeared first on .+?\.", re.IGNORECASE),
+    re.compile(r"\b(Continue reading|Read more|Read the full story)\b.*$", re.IGNORECASE | re.MULTILINE),
+]
+_sentence_split = re.compile(r"(?<=[.!?])\s+")
+
+
+def strip_html(text: str) -> str:
+    """Convert an HTML fragment to plain text, keeping paragraph breaks."""
+    if "<" not in text and "&" not in text:
+        return text
+    extractor = _TextExtractor()
+    extractor.feed(text)
+    extractor.close()
+    return "".join(extractor.parts)
+
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(words(sentence))
+
+
+def compact_text(text: str, token_budget: int, seen_sentences: set = None) -> str:
+    """
+    Strip HTML and boilerplate, normalise whitespace, drop sentences already in seen_sentences
+    (which is updated), and truncate to roughly token_budget tokens at a sentence or word boundary.
+    """
+    seen_sentences = seen_sentences if seen_sentences is not None else set()
+    text = strip_html(text)
+    for pattern in _boilerplate_patterns:
+        text = pattern.sub("", text)
+
+    paragraphs = []
+    remaining = token_budget
+    for paragraph in re.split(r"\n\s*\n", text):
+        sentences = []
+        for sentence in _sentence_split.split(" ".join(paragraph.split())):
+            key = _sentence_key(sentence)
+            if not key or key in seen_sentences:
+                continue
+
+            sentence_tokens = estimate_tokens(sentence) + 1
+            if sentence_tokens > remaining:
+                # Keep as much of the first sentence that doesn't fit as the budget allows
+                cut = sentence[:remaining * chars_per_token].rsplit(" ", 1)[0]
+                if len(cut) > 20:
+                    sentences.append(cut + "…")
+                remaining = 0
+                break
+
+            seen_sentences.add(key)
+            sentences.append(sentence)
+            remaining -= sentence_tokens
+
+        if sentences:
+            paragraphs.append(" ".join(sentences))
+        if remaining <= 0:
+            break
+
+    return "\n".join(paragraphs)
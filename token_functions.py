@@ -0,0 +1,79 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+from aws_functions import get_secret, save_tokens_to_secrets
+from tracing_functions import span
+
+logger = logging.getLogger()
+
+# Tokens are only refreshed once they are this close to expiring
+token_refresh_window = datetime.timedelta(days=float(os.environ.get("TOKEN_REFRESH_WINDOW_DAYS", "7")))
+
+
+def parse_expiry(value):
+    """Parse a stored expiry (ISO string or datetime) into an aware UTC datetime, or None."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def is_token_fresh(token, expiry, window: datetime.timedelta = token_refresh_window) -> bool:
+    """True if the token exists and doesn't expire within the window."""
+    expiry = parse_expiry(expiry)
+    if not token or expiry is None:
+        return False
+    return datetime.datetime.now(datetime.timezone.utc) + window < expiry
+
+
+class TokenManager:
+    """
+    Keeps an access token and its expiry side by side in a Secrets Manager secret.
+
+    get_token returns the stored token until it is inside the refresh window, and only then
+    calls refresh(secrets), which must return (fields to update in the secret, expires_in seconds),
+    or None to keep using the stored token (e.g. when it can't be refreshed but may still work).
+    A token with no stored expiry is refreshed once so its expiry becomes known.
+    """
+
+    def __init__(self, secret_name: str, refresh, token_key: str = "access_token",
+                 expiry_key: str = "token_expiry", refresh_window: datetime.timedelta = None):
+        self.secret_name = secret_name
+        self.refresh = refresh
+        self.token_key = token_key
+        self.expiry_key = expiry_key
+        self.refresh_window = refresh_window if refresh_window is not None else token_refresh_window
+        # Several platforms can share a secret and run concurrently; only one of them should refresh it
+        self.lock = threading.RLock()
+
+    def get_token(self) -> str:
+        with self.lock:
+            secrets = json.loads(get_secret(self.secret_name))
+            token = secrets.get(self.token_key)
+
+            if is_token_fresh(token, secrets.get(self.expiry_key), self.refresh_window):
+                return token
+
+            logger.info(f"Refreshing {self.secret_name} {self.token_key} (expiry: {secrets.get(self.expiry_key)})")
+            with span("token_refresh", secret_name=self.secret_name):
+                refreshed = self.refresh(secrets)
+            if refreshed is None:
+                return token
+
+            updates, expires_in = refreshed
+            expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=int(expires_in))
+
+            secrets.update(updates)
+            secrets[self.expiry_key] = expiry.isoformat()
+            save_tokens_to_secrets(secret_name=self.secret_name, tokens=secrets)
+
+            return secrets[self.token_key]
@@ -0,0 +1,273 @@
+import datetime
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+# CloudWatch embedded metric format (EMF) output, on by default when running in Lambda
+metrics_namespace = os.environ.get("METRICS_NAMESPACE", "Socials")
+emf_enabled = os.environ.get(
+    "EMF_METRICS",
+    "true" if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else ""
+) == "true"
+
+# Most spans kept per run, so a long-lived local process doesn't grow without bound
+max_spans = int(os.environ.get("TRACE_MAX_SPANS", "2000"))
+
+# Numeric span attributes published as metrics: attribute -> (metric name, unit)
+metric_attributes = {
+    "duration_ms": ("Latency", "Milliseconds"),
+    "bytes": ("Bytes", "Bytes"),
+    "input_tokens": ("InputTokens", "Count"),
+    "output_tokens": ("OutputTokens", "Count"),
+    "retries": ("Retries", "Count"),
+}
+
+# EMF allows at most 100 values per metric in one document
+emf_max_values = 100
+
+
+class Span:
+    """One timed stage of a run, with its parent span and free-form attributes."""
+
+    def __init__(self, name: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.thread = threading.current_thread().name
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def increment(self, name: str, amount=1):
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.id,
+            "parent_id": self.parent_id,
+            "thread": self.thread,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Collects the spans of the current run.
+
+    Spans nest per thread; work handed to a thread pool keeps its parent when the callable is
+    passed through wrap(). Each finished span is logged as a structured record, and
+    finish_run() returns a per-stage summary and, if enabled, prints CloudWatch EMF metrics.
+    """
+
+    def __init__(self):
+        self.run_id = None
+        self.run_attributes = {}
+        self.started = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start_run(self, **attributes):
+        with self._lock:
+            self.run_id = uuid.uuid4().hex
+            self.run_attributes = attributes
+            self.started = time.perf_counter()
+            self.spans = []
+            self.dropped = 0
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self) -> Span:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        stack = self._stack()
+        parent = stack[-1] if stack else getattr(self._local, "parent", None)
+        span = Span(name, parent.id if parent else None, attributes)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            span.duration_ms = round((time.perf_counter() - span.started) * 1000, 1)
+            self._record(span)
+
+    def _record(self, span: Span):
+        with self._lock:
+            if len(self.spans) < max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+        fields = dict(span.to_dict(), event="span", run_id=self.run_id)
+        level = logging.WARNING if span.error else logging.INFO
+        logger.log(level, f"{span.name} took {span.duration_ms}ms{' (failed)' if span.error else ''}",
+                   extra={"fields": fields})
+
+    def wrap(self, fn):
+        """Bind fn to the current span, so spans it opens on another thread nest under it."""
+        parent = self.current() or getattr(self._local, "parent", None)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            previous = getattr(self._local, "parent", None)
+            self._local.parent = parent
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.parent = previous
+
+        return wrapper
+
+    def summary(self) -> dict:
+        """Per-stage counts, latency and summed numeric attributes for the run so far."""
+        with self._lock:
+            spans = list(self.spans)
+            dropped = self.dropped
+
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span.name, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stage["count"] += 1
+            stage["errors"] += int(span.error is not None)
+            stage["total_ms"] = round(stage["total_ms"] + span.duration_ms, 1)
+            stage["max_ms"] = max(stage["max_ms"], span.duration_ms)
+            for attribute in metric_attributes:
+                value = span.attributes.get(attribute)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage[attribute] = stage.get(attribute, 0) + value
+
+        return {
+            "run_id": self.run_id,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": len(spans),
+            "dropped_spans": dropped,
+            "stages": stages,
+        }
+
+    def emf_documents(self) -> list:
+        """CloudWatch EMF documents for the run's spans, one per stage, dimensioned by stage."""
+        with self._lock:
+            spans = list(self.spans)
+
+        values = {}
+        for span in spans:
+            stage = values.setdefault(span.name, {"Errors": []})
+            stage["Errors"].append(int(span.error is not None))
+            for attribute, (metric, _) in metric_attributes.items():
+                value = span.duration_ms if attribute == "duration_ms" else span.attributes.get(attribute)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage.setdefault(metric, []).append(value)
+
+        units = dict(metric_attributes.values(), Errors="Count")
+        timestamp = int(time.time() * 1000)
+        documents = []
+        for stage, metrics in values.items():
+            document = {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": metrics_namespace,
+                        "Dimensions": [["Stage"]],
+                        "Metrics": [{"Name": metric, "Unit": units[metric]} for metric in metrics]
+                    }]
+                },
+                "Stage": stage,
+                "RunId": self.run_id,
+            }
+            for metric, metric_values in metrics.items():
+                document[metric] = metric_values[:emf_max_values]
+            documents.append(document)
+        return documents
+
+    def finish_run(self) -> dict:
+        """Log the run summary, print EMF metrics if enabled, and return the summary."""
+        summary = self.summary()
+        logger.info(f"Run finished in {summary['duration_ms']}ms", extra={"fields": dict(summary, event="run")})
+
+        if emf_enabled:
+            # EMF must be a bare JSON line on stdout, which Lambda forwards to CloudWatch Logs
+            for document in self.emf_documents():
+                sys.stdout.write(json.dumps(document) + "\n")
+            sys.stdout.flush()
+        return summary
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """Context manager timing a stage of the current run: `with span("bedrock", model_id=...) as s:`."""
+    return tracer.span(name, **attributes)
+
+
+def traced(name: str = None):
+    """Decorator running the function inside a span named after it (or name)."""
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def set_span_attributes(**attributes):
+    """Add attributes (bytes, input_tokens, ...) to the innermost open span on this thread, if any."""
+    current = tracer.current()
+    if current is not None:
+        current.set(**attributes)
+
+
+def increment_span_attribute(name: str, amount=1):
+    current = tracer.current()
+    if current is not None:
+        current.increment(name, amount)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as single-line JSON, including the run id, open span and any `fields` extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+            "run_id": tracer.run_id,
+        }
+        current = tracer.current()
+        if current is not None:
+            entry["span"] = current.name
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
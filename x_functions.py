@@ -3,41 +3,66 @@ import os
 import tweepy
 import logging
 from aws_functions import get_secret
+from http_functions import get_http_session
+from tracing_functions import traced
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%H:%M:%S'  # Hours:Minutes:Seconds format (no milliseconds)
-)
 logger = logging.getLogger()
 
-def post_tweet(tweet_text):
-    try:
-        bearer = os.environ['X_BearerToken']
-        api = os.environ['X_APIKey']
-        api_secret = os.environ['X_APIKeySecret']
-        access = os.environ['X_AccessToken']
-        secret = os.environ['X_AccessTokenSecret']
+# Clients keyed by credentials, so a client (and its connections) is only rebuilt when the keys change
+_clients = {}
 
-        logger.info(f"attempting to initialise client with {bearer}")
 
+def get_twitter_client(bearer, api, api_secret, access, secret) -> tweepy.Client:
+    key = (bearer, api, api_secret, access, secret)
+    if key not in _clients:
         client = tweepy.Client(bearer_token=bearer, access_token=access, access_token_secret=secret, consumer_key=api, consumer_secret=api_secret)
+        client.session = get_http_session("api.twitter.com")
+        _clients[key] = client
+    return _clients[key]
+
+
+@traced()
+def post_tweet(tweet_text, credentials: dict = None):
+    """Post a tweet with the given credentials (see get_twitter_credentials), or those set by setup_twitter_vars."""
+    try:
+        if credentials is None:
+            credentials = {
+                'BearerToken': os.environ['X_BearerToken'],
+                'APIKey': os.environ['X_APIKey'],
+                'APIKeySecret': os.environ['X_APIKeySecret'],
+                'AccessToken': os.environ['X_AccessToken'],
+                'AccessTokenSecret': os.environ['X_AccessTokenSecret'],
+            }
+        bearer = credentials['BearerToken']
+        api = credentials['APIKey']
+        api_secret = credentials['APIKeySecret']
+        access = credentials['AccessToken']
+        secret = credentials['AccessTokenSecret']
+
+        logger.info("attempting to initialise the X client")
+
+        client = get_twitter_client(bearer, api, api_secret, access, secret)
 
         logger.info(f"attempting to post tweet {tweet_text}")
         tweet = client.create_tweet(text=tweet_text)
 
-        print(f"Successfully posted tweet with ID: {tweet.data['id']}")
+        logger.info(f"Successfully posted tweet with ID: {tweet.data['id']}")
     except tweepy.TweepyException as e:
-        print(f"Failed to post tweet: {e}")
+        logger.error(f"Failed to post tweet: {e}")
+        raise
+
+
+def get_twitter_credentials(secret_name: str = "TwitterAPICredentials") -> dict:
+    """The X API keys stored in the secret."""
+    secrets = json.loads(get_secret(secret_name=secret_name))
+    return {key: secrets[key] for key in ('APIKey', 'APIKeySecret', 'AccessToken', 'AccessTokenSecret', 'BearerToken')}
 
-def setup_twitter_vars():
-    secret = get_secret(secret_name = "TwitterAPICredentials")
 
-    logger.info(f"SECRET: ", secret)
-    secrets = json.loads(secret)
+def setup_twitter_vars(secret_name: str = "TwitterAPICredentials"):
+    secrets = get_twitter_credentials(secret_name)
 
     os.environ['X_APIKey'] = secrets['APIKey']
     os.environ['X_APIKeySecret'] = secrets['APIKeySecret']
     os.environ['X_AccessToken'] = secrets['AccessToken']
     os.environ['X_AccessTokenSecret'] = secrets['AccessTokenSecret']
-    os.environ['X_BearerToken'] = secrets['BearerToken']
\ No newline at end of file
+    os.environ['X_BearerToken'] = secrets['BearerToken']